@@ -1 +1,173 @@
+import sys
+import time
+import tracemalloc
 
+import cv2
+import numpy as np
+
+
+# =====================
+# کش فریم‌ها: حلقه‌ی از پیش تخصیص‌یافته + آمار هر فریم و هر ناحیه‌ی ماسک
+# =====================
+class FrameHistory:
+    def __init__(self, size, H, W):
+        self.size = size
+        self.frames = None
+        self.ensure(H, W)
+
+    def ensure(self, H, W):
+        if self.frames is None or self.frames.shape[1:] != (H, W):
+            self.frames = np.zeros((self.size, H, W), dtype=np.uint8)
+            self.reset()
+        return self
+
+    def reset(self):
+        self.head = 0    # خانه‌ی بعدی برای نوشتن
+        self.count = 0
+        self.means = np.zeros(self.size)     # میانگین روشنایی هر فریم
+        self.regions = None                  # (size, تعداد ماسک‌ها) میانگین روشنایی هر ناحیه
+        self.region_key = None
+
+    def __len__(self):
+        return self.count
+
+    def slot(self):
+        # بافر فریم بعدی؛ وقتی حلقه پر باشد همان قدیمی‌ترین فریم است که بیرون می‌رود
+        return self.frames[self.head]
+
+    def push(self, engine):
+        # فریم باید قبلاً در slot() نوشته شده باشد
+        i = self.head
+        gray = self.frames[i]
+        if self.region_key != engine.bank.key:
+            self._rebuild_regions(engine)
+        if self.count < self.size:
+            self.count += 1
+
+        self.means[i] = cv2.mean(gray)[0]
+        self.regions[i] = engine.region_means(gray)[:, 0]
+        self.head = (i + 1) % self.size
+        return gray
+
+    def _rebuild_regions(self, engine):
+        # فقط وقتی مجموعه‌ی ماسک‌ها عوض شود
+        self.regions = np.zeros((self.size, len(engine.bank.angles)))
+        for j in self._order():
+            self.regions[j] = engine.region_means(self.frames[j])[:, 0]
+        self.region_key = engine.bank.key
+
+    def _order(self):
+        # اندیس خانه‌ها از قدیمی‌ترین تا جدیدترین
+        start = (self.head - self.count) % self.size
+        return [(start + k) % self.size for k in range(self.count)]
+
+    @property
+    def newest(self):
+        return (self.head - 1) % self.size
+
+    @property
+    def oldest(self):
+        return (self.head - self.count) % self.size
+
+    def brightness_diff(self):
+        # اختلاف روشنایی هر ناحیه بین فریم مرجع (قدیمی‌ترین) و فریم جاری
+        return self.regions[self.oldest] - self.regions[self.newest]
+
+
+# =====================
+# ورودی مدل‌های ONNX: تنسور NCHW float32 از پیش تخصیص‌یافته + تغییر اندازه و نرمال‌سازی در همان بافر
+# =====================
+class ModelInput:
+    def __init__(self, size, letterbox=False, pad_value=114, swap_rb=False, scale=1 / 255.0):
+        self.W, self.H = size
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+        self.swap_rb = swap_rb
+        self.scale = np.float32(scale)
+        self.tensor = np.zeros((1, 3, self.H, self.W), dtype=np.float32)
+        self.key = None
+        self.ratio = (1.0, 1.0)  # برای برگرداندن جعبه‌ها به مختصات تصویر ورودی (decode_yolo)
+        self.pad = (0, 0)
+
+    def _prepare(self, shape):
+        # فقط با تغییر اندازه‌ی تصویر ورودی دوباره ساخته می‌شود
+        h, w = shape[:2]
+        if self.letterbox:
+            r = min(self.W / w, self.H / h)
+            nw, nh = int(round(w * r)), int(round(h * r))
+            px, py = (self.W - nw) // 2, (self.H - nh) // 2
+            self.ratio = (r, r)
+            self.pad = (px, py)
+        else:
+            nw, nh, px, py = self.W, self.H, 0, 0
+            self.ratio = (self.W / w, self.H / h)
+            self.pad = (0, 0)
+
+        # حاشیه یک بار پر می‌شود و بعداً هیچ‌وقت بازنویسی نمی‌شود
+        self.tensor.fill(self.pad_value * self.scale)
+        self.content = self.tensor[0, :, py:py + nh, px:px + nw]
+        self.resized = None if (nw, nh) == (w, h) else np.zeros((nh, nw, 3), dtype=np.uint8)
+        self.planes = np.zeros((3, nh, nw), dtype=np.uint8)
+        # cv2.split مستقیم در صفحه‌های بافر می‌نویسد؛ ترتیب معکوس = BGR به RGB
+        order = list(self.planes)
+        self.split_dst = order[::-1] if self.swap_rb else order
+        self.key = shape
+
+    def fill(self, img):
+        # خروجی: self.tensor (در فراخوانی بعدی بازنویسی می‌شود)
+        if img.shape != self.key:
+            self._prepare(img.shape)
+        if self.resized is not None:
+            img = cv2.resize(img, self.resized.shape[1::-1], dst=self.resized, interpolation=cv2.INTER_LINEAR)
+        cv2.split(img, self.split_dst)
+        np.multiply(self.planes, self.scale, out=self.content)
+        return self.tensor
+
+
+# =====================
+# بنچمارک تخصیص حافظه‌ی پیش‌پردازش دو مدل در هر فریم (قبل و بعد از ModelInput)
+# python -m modules.module1_stream.preprocessor [frames]
+# =====================
+def _legacy_inputs(frame):
+    img = cv2.resize(frame, (640, 480))
+    yolo = cv2.resize(img, (640, 640)).transpose(2, 0, 1)[np.newaxis, ...].astype(np.float32) / 255.0
+    midas = cv2.resize(img, (256, 256)).transpose(2, 0, 1)[np.newaxis, ...].astype(np.float32) / 255.0
+    return yolo, midas
+
+
+def _shared_inputs(frame, base, yolo, midas):
+    img = cv2.resize(frame, (640, 480), dst=base)
+    return yolo.fill(img), midas.fill(img)
+
+
+def _measure(step, frames):
+    step(frames[0])
+    tracemalloc.start()
+    peaks = []
+    t0 = time.perf_counter()
+    for frame in frames:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    dt = time.perf_counter() - t0
+    tracemalloc.stop()
+    return {"alloc_kb_per_frame": round(float(np.mean(peaks)) / 1024, 1),
+            "ms_per_frame": round(dt / len(frames) * 1000, 2)}
+
+
+def benchmark(n_frames=50, W=1280, H=720):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (H, W, 3), dtype=np.uint8) for _ in range(n_frames)]
+    base = np.zeros((480, 640, 3), dtype=np.uint8)
+    yolo, midas = ModelInput((640, 640), letterbox=True), ModelInput((256, 256))
+    return {
+        "before": _measure(_legacy_inputs, frames),
+        "after": _measure(lambda f: _shared_inputs(f, base, yolo, midas), frames),
+    }
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for name, result in benchmark(n).items():
+        print(f"{name:<7} {result}")
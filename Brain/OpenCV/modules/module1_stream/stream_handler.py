@@ -1 +1,171 @@
+import sys
+import threading
+import time
 
+import cv2
+import numpy as np
+import requests
+
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+
+
+# =====================
+# پارسر MJPEG بدون کپی (bytearray قابل استفاده مجدد + memoryview)
+# =====================
+class MjpegParser:
+    def __init__(self, capacity=256 * 1024):
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.start = 0   # ابتدای داده‌ی مصرف‌نشده
+        self.end = 0     # انتهای داده‌ی نوشته‌شده
+        self.scan = 0    # جستجو از همین‌جا ادامه پیدا می‌کند
+        self.soi = -1    # محل SOI فریم جاری (اگر پیدا شده باشد)
+
+    def feed(self, chunk):
+        n = len(chunk)
+        if self.start == self.end:
+            self.start = self.end = self.scan = 0
+        if self.end + n > len(self.buf):
+            self._make_room(n)
+        self.buf[self.end:self.end + n] = chunk
+        self.end += n
+
+    def _make_room(self, n):
+        # فقط دنباله‌ی ناقص فریم جاری به ابتدای بافر منتقل می‌شود
+        pending = self.end - self.start
+        if pending + n > len(self.buf):
+            size = len(self.buf)
+            while pending + n > size:
+                size *= 2
+            new_buf = bytearray(size)
+            new_buf[:pending] = self.view[self.start:self.end]
+            self.buf, self.view = new_buf, memoryview(new_buf)
+        else:
+            self.buf[:pending] = self.buf[self.start:self.end]
+        shift = self.start
+        self.start, self.end = 0, pending
+        self.scan -= shift
+        if self.soi != -1:
+            self.soi -= shift
+
+    def frames(self):
+        # memoryview هر فریم فقط تا فراخوانی بعدی feed معتبر است
+        while True:
+            if self.soi == -1:
+                a = self.buf.find(SOI, self.scan, self.end)
+                if a == -1:
+                    # داده‌ی قبل از SOI دور ریخته می‌شود؛ یک بایت برای مارکر نصفه نگه داشته می‌شود
+                    self.start = self.scan = max(self.start, self.end - 1)
+                    return
+                self.soi = self.start = a
+                self.scan = a + 2
+            b = self.buf.find(EOI, self.scan, self.end)
+            if b == -1:
+                self.scan = max(self.scan, self.end - 1)
+                return
+            jpg = self.view[self.soi:b + 2]
+            self.start = self.scan = b + 2
+            self.soi = -1
+            yield jpg
+
+    def reset(self):
+        self.start = self.end = self.scan = 0
+        self.soi = -1
+
+
+def decode_jpeg(jpg):
+    return cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+# =====================
+# نخ خواننده‌ی استریم (خواندن blocking از requests خارج از event loop)
+# =====================
+class StreamReader(threading.Thread):
+    def __init__(self, url, on_jpeg, chunk_size=1024, timeout=20):
+        super().__init__(name="stream-reader", daemon=True)
+        self.url = url
+        self.on_jpeg = on_jpeg
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            with requests.get(self.url, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+                parser = MjpegParser()
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    if self.stop_event.is_set():
+                        break
+                    parser.feed(chunk)
+                    for jpg in parser.frames():
+                        # view بعد از feed بعدی بازنویسی می‌شود، پس برای نخ دیگر کپی می‌کنیم
+                        self.on_jpeg(time.perf_counter(), bytes(jpg))
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        self.stop_event.set()
+
+
+# =====================
+# بنچمارک: بازپخش استریم ضبط‌شده ESP32 از فایل
+# python -m modules.module1_stream.stream_handler recording.mjpg
+# =====================
+def _legacy_frames(chunks):
+    bytes_data = b''
+    for chunk in chunks:
+        bytes_data += chunk
+        a = bytes_data.find(SOI)
+        b = bytes_data.find(EOI)
+        if a != -1 and b != -1:
+            jpg = bytes_data[a:b+2]
+            bytes_data = bytes_data[b+2:]
+            yield jpg
+
+
+def _parser_frames(chunks):
+    parser = MjpegParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from parser.frames()
+
+
+def _synthetic_stream(n_frames=200, size=(320, 240)):
+    rng = np.random.default_rng(0)
+    parts = []
+    for _ in range(n_frames):
+        img = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        _, jpg = cv2.imencode(".jpg", img)
+        parts.append(b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpg.tobytes() + b"\r\n")
+    return b"".join(parts)
+
+
+def benchmark(data, chunk_size=1024, decode=False):
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    results = {}
+    for name, extractor in (("legacy", _legacy_frames), ("parser", _parser_frames)):
+        t0 = time.perf_counter()
+        count = 0
+        for jpg in extractor(chunks):
+            if decode:
+                decode_jpeg(jpg)
+            count += 1
+        dt = time.perf_counter() - t0
+        results[name] = {"frames": count, "seconds": round(dt, 4),
+                         "fps": round(count / dt, 1) if dt else 0.0}
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        data = _synthetic_stream()
+    print(f"stream: {len(data) / 1e6:.2f} MB")
+    for decode in (False, True):
+        for name, r in benchmark(data, decode=decode).items():
+            print(f"{name:<7} decode={decode!s:<5} frames={r['frames']:<5} {r['seconds']}s  {r['fps']} fps")
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+
+# =====================
+# تنظیم نخ‌های onnxruntime برای اجرای هم‌زمان چند مدل روی CPU
+# =====================
+def threads_per_model(n_models, cores=None):
+    cores = cores or os.cpu_count() or 1
+    return max(1, cores // n_models)
+
+
+def session_options(intra_op_num_threads=0, inter_op_num_threads=1):
+    # 0 یعنی انتخاب خودکار توسط onnxruntime
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra_op_num_threads
+    opts.inter_op_num_threads = inter_op_num_threads
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return opts
+
+
+# =====================
+# زمان‌بند استنتاج: هر مدل روی نخ اختصاصی خودش، خروجی به صورت Future
+# =====================
+class InferenceScheduler:
+    def __init__(self, names=()):
+        self.workers = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        if name not in self.workers:
+            self.workers[name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ort-{name}")
+
+    def submit(self, name, fn, *args):
+        return self.workers[name].submit(fn, *args)
+
+    async def run(self, name, fn, *args):
+        return await asyncio.wrap_future(self.submit(name, fn, *args))
+
+    def shutdown(self, wait=True):
+        for worker in self.workers.values():
+            worker.shutdown(wait=wait)
+        self.workers.clear()
+
+
+# =====================
+# تازه‌سازی تطبیقی نتیجه‌ی مدل: استفاده‌ی دوباره از آخرین نتیجه وقتی صحنه تقریباً ثابت است
+# =====================
+def motion_thumbnail(img, out=None, size=(64, 48)):
+    # تصویر خاکستری خیلی کوچک برای مقایسه‌ی ارزان فریم‌ها
+    small = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=out)
+    if out is None:
+        return small
+    np.copyto(out, small)
+    return out
+
+
+class RefreshGate:
+    def __init__(self, max_age=0.5, motion_threshold=4.0, min_age=0.0):
+        self.max_age = max_age                    # حداکثر عمر نتیجه (ثانیه)؛ حداقل نرخ تازه‌سازی
+        self.motion_threshold = motion_threshold  # میانگین اختلاف روشنایی (0..255) نسبت به فریم آخرین تازه‌سازی
+        self.min_age = min_age                    # حداقل فاصله‌ی دو تازه‌سازی حتی با حرکت زیاد
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.reference = None
+        self.last_time = float("-inf")
+        self.stats = {"first": 0, "age": 0, "motion": 0, "reused": 0}
+
+    def motion(self, thumb):
+        return float(cv2.mean(cv2.absdiff(thumb, self.reference))[0])
+
+    def due(self, thumb, now=None):
+        # True یعنی مدل باید روی این فریم اجرا شود (بعد از اجرا store صدا زده شود)
+        now = time.monotonic() if now is None else now
+        age = now - self.last_time
+        if self.reference is None or self.reference.shape != thumb.shape:
+            reason = "first"
+        elif age >= self.max_age:
+            reason = "age"
+        elif age >= self.min_age and self.motion(thumb) >= self.motion_threshold:
+            reason = "motion"
+        else:
+            self.stats["reused"] += 1
+            return False
+        self.stats[reason] += 1
+        return True
+
+    def store(self, value, thumb, now=None):
+        self.value = value
+        self.last_time = time.monotonic() if now is None else now
+        if self.reference is None or self.reference.shape != thumb.shape:
+            self.reference = np.empty_like(thumb)
+        np.copyto(self.reference, thumb)
+        return value
+
+
+def dummy_feed(sess):
+    # ورودی تصادفی هم‌شکل ورودی مدل (ابعاد پویا = 1) برای گرم کردن و بنچمارک
+    inp = sess.get_inputs()[0]
+    shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+    return {inp.name: np.random.rand(*shape).astype(np.float32)}
+
+
+# =====================
+# بنچمارک CPU: اجرای پشت‌سرهم در برابر اجرای موازی دو مدل
+# python -m modules.module2_vision.inference yolo11n.onnx midas_small.onnx [iterations]
+# =====================
+
+
+def benchmark(model_paths, iterations=20):
+    providers = ['CPUExecutionProvider']
+    cores = os.cpu_count() or 1
+    results = {"cores": cores}
+
+    # پشت‌سرهم: هر مدل همه‌ی هسته‌ها را می‌گیرد
+    sessions = [ort.InferenceSession(p, sess_options=session_options(cores), providers=providers)
+                for p in model_paths]
+    feeds = [dummy_feed(s) for s in sessions]
+    singles = []
+    for sess, feed in zip(sessions, feeds):
+        sess.run(None, feed)
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            sess.run(None, feed)
+        singles.append((time.perf_counter() - t0) / iterations)
+    results["single_ms"] = [round(s * 1000, 2) for s in singles]
+    results["sequential_ms"] = round(sum(singles) * 1000, 2)
+
+    # موازی: هسته‌ها بین مدل‌ها تقسیم می‌شوند و هر مدل نخ خودش را دارد
+    per_model = threads_per_model(len(model_paths), cores)
+    sessions = [ort.InferenceSession(p, sess_options=session_options(per_model), providers=providers)
+                for p in model_paths]
+    names = [f"m{i}" for i in range(len(sessions))]
+    scheduler = InferenceScheduler(names)
+    for sess, feed in zip(sessions, feeds):
+        sess.run(None, feed)
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        futures = [scheduler.submit(n, s.run, None, f) for n, s, f in zip(names, sessions, feeds)]
+        for fut in futures:
+            fut.result()
+    results["parallel_ms"] = round((time.perf_counter() - t0) / iterations * 1000, 2)
+    results["threads_per_model"] = per_model
+    scheduler.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python -m modules.module2_vision.inference yolo.onnx midas.onnx [iterations]")
+        sys.exit(1)
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    print(benchmark(sys.argv[1:3], iterations))
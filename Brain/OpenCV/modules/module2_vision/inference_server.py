@@ -0,0 +1,223 @@
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+from modules.module2_vision.inference import InferenceScheduler, session_options, threads_per_model
+from modules.module1_stream.preprocessor import ModelInput
+
+
+# =====================
+# اجرای دسته‌ای یک سشن: ورودی (B, 3, H, W) -> لیست خروجی‌ها با بعد اول B
+# =====================
+def session_runner(sess):
+    inp = sess.get_inputs()[0]
+    if isinstance(inp.shape[0], int) and inp.shape[0] == 1:
+        # مدل با batch ثابت export شده؛ سشن مشترک می‌ماند ولی آیتم‌ها پشت‌سرهم اجرا می‌شوند
+        def run(batch):
+            outs = [sess.run(None, {inp.name: batch[i:i + 1]}) for i in range(len(batch))]
+            return [np.concatenate(parts) for parts in zip(*outs)]
+        return run
+    return lambda batch: sess.run(None, {inp.name: batch})
+
+
+# =====================
+# سرور استنتاج با micro-batch پویا: آیتم‌ها تا پر شدن دسته یا رسیدن مهلت جمع می‌شوند
+# =====================
+class BatchInferenceServer:
+    def __init__(self, name, run_batch, input_shape, max_batch=4, max_latency=0.01, scheduler=None):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_latency = max_latency    # حداکثر انتظار اولین آیتم دسته (ثانیه)
+        self.scheduler = scheduler or InferenceScheduler()
+        self.scheduler.add(name)
+        self.queue = asyncio.Queue()
+        # بافر دسته یک بار تخصیص می‌یابد؛ ورودی‌ها فقط در آن کپی می‌شوند
+        self.batch = np.zeros((max_batch,) + tuple(input_shape), dtype=np.float32)
+        self.stats = {"batches": 0, "items": 0, "deadline": 0, "full": 0}
+
+    async def infer(self, key, tensor):
+        # tensor: (1, 3, H, W) یا (3, H, W)؛ تا شروع دسته نباید بازنویسی شود
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((time.monotonic(), key, tensor, fut))
+        return await fut
+
+    async def _collect(self):
+        first = await self.queue.get()
+        items = [first]
+        deadline = first[0] + self.max_latency
+        while len(items) < self.max_batch:
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self.stats["full" if len(items) == self.max_batch else "deadline"] += 1
+        return items
+
+    async def run(self, is_running=lambda: True):
+        while is_running():
+            items = await self._collect()
+            n = len(items)
+            for i, (_, _, tensor, _) in enumerate(items):
+                self.batch[i] = tensor.reshape(self.batch.shape[1:])
+            try:
+                outputs = await self.scheduler.run(self.name, self.run_batch, self.batch[:n])
+            except Exception as e:
+                for _, _, _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            # هر ربات برش خودش را می‌گیرد (کپی، چون خروجی دسته‌ی بعد را نگه نمی‌داریم)
+            for i, (_, _, _, fut) in enumerate(items):
+                if not fut.done():
+                    fut.set_result([out[i:i + 1].copy() for out in outputs])
+            self.stats["batches"] += 1
+            self.stats["items"] += n
+
+    def mean_batch(self):
+        return self.stats["items"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+
+# =====================
+# سرویس چند رباتی: یک نسخه از هر مدل برای همه‌ی ربات‌ها (مثلاً r1, r2, r3)
+# =====================
+class InferenceService:
+    def __init__(self, servers, inputs):
+        # servers: name -> BatchInferenceServer ؛ inputs: name -> (size, kwargs برای ModelInput)
+        self.servers = servers
+        self.inputs = inputs
+        self.robot_inputs = {}   # (robot_id, name) -> ModelInput (بافر جدا برای هر ربات)
+
+    def _input(self, robot_id, name):
+        key = (robot_id, name)
+        if key not in self.robot_inputs:
+            size, kwargs = self.inputs[name]
+            self.robot_inputs[key] = ModelInput(size, **kwargs)
+        return self.robot_inputs[key]
+
+    async def infer(self, robot_id, img):
+        # خروجی: name -> (خروجی‌های مدل، ModelInput برای ratio/pad)
+        # هر ربات باید منتظر نتیجه بماند و بعد فریم بعدی را بفرستد (بافر ورودی‌اش مشترک نیست ولی تکی است)
+        names = list(self.servers)
+        model_inputs = [self._input(robot_id, name) for name in names]
+        results = await asyncio.gather(*(self.servers[name].infer(robot_id, mi.fill(img))
+                                         for name, mi in zip(names, model_inputs)))
+        return {name: (out, mi) for name, out, mi in zip(names, results, model_inputs)}
+
+    async def run(self, is_running=lambda: True):
+        await asyncio.gather(*(server.run(is_running) for server in self.servers.values()))
+
+    def stats(self):
+        return {name: dict(server.stats, mean_batch=round(server.mean_batch(), 2))
+                for name, server in self.servers.items()}
+
+
+# =====================
+# بنچمارک با تولیدکننده‌های فریم مصنوعی: N ربات، batch=1 در برابر micro-batch
+# python -m modules.module2_vision.inference_server yolo.onnx midas.onnx [robots] [seconds]
+# =====================
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def build_service(model_paths, max_batch, max_latency, providers=None):
+    providers = providers or ['CPUExecutionProvider']
+    scheduler = InferenceScheduler()
+    per_model = threads_per_model(len(model_paths))
+    servers, inputs = {}, {}
+    for path in model_paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        sess = ort.InferenceSession(path, sess_options=session_options(per_model), providers=providers)
+        shape = [d if isinstance(d, int) else 1 for d in sess.get_inputs()[0].shape][1:]
+        servers[name] = BatchInferenceServer(name, session_runner(sess), shape, max_batch,
+                                             max_latency, scheduler)
+        inputs[name] = ((shape[2], shape[1]), {})
+    return InferenceService(servers, inputs)
+
+
+async def _producer(service, robot_id, seconds, latencies, rng):
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    end = time.monotonic() + seconds
+    count = 0
+    while time.monotonic() < end:
+        # فریم مصنوعی متغیر (جابجایی افقی) تا ورودی‌ها یکسان نباشند
+        img = np.roll(frame, count * 8, axis=1)
+        t0 = time.perf_counter()
+        await service.infer(robot_id, img)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        count += 1
+    return count
+
+
+async def _serve(services, seconds):
+    # services: یک سرویس برای هر ربات (ممکن است همه یکی باشند)
+    running = True
+    unique = list({id(s): s for s in services}.values())
+    tasks = [asyncio.ensure_future(s.run(lambda: running)) for s in unique]
+    rng = np.random.default_rng(0)
+    latencies = []
+    counts = await asyncio.gather(*(_producer(service, f"r{i + 1}", seconds, latencies, rng)
+                                    for i, service in enumerate(services)))
+    running = False
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {"fps_total": round(sum(counts) / seconds, 1),
+            "fps_per_core": round(sum(counts) / seconds / (os.cpu_count() or 1), 2),
+            "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1),
+            "models": unique[0].stats() if len(unique) == 1 else "per-robot"}
+
+
+def _run_config(model_paths, robots, copies, max_batch, seconds, max_latency):
+    # در پروسه‌ی جدا اجرا می‌شود تا حافظه‌ی پیکربندی قبلی (که allocator نگه می‌دارد) روی اندازه‌گیری اثر نگذارد
+    # load: RSS بعد از ساخت سشن‌ها ؛ peak: اوج RSS در حین اجرا (شامل arena ورودی/خروجی batch)
+    # هر دو نسبت به RSS قبل از ساخت سشن‌ها
+    rss0 = _rss_mb()
+    built = [build_service(model_paths, max_batch, max_latency) for _ in range(copies)]
+    load_mb = _rss_mb() - rss0
+    services = [built[i % copies] for i in range(robots)]
+    result = asyncio.run(_serve(services, seconds))
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - rss0   # لینوکس: KB
+    result.update(load_mb=round(load_mb, 1), peak_mb=round(peak_mb, 1),
+                  load_mb_per_robot=round(load_mb / robots, 1),
+                  peak_mb_per_robot=round(peak_mb / robots, 1))
+    return result
+
+
+def benchmark(model_paths, robots=3, seconds=5.0, max_latency=0.01):
+    # per_robot: وضعیت فعلی (هر ربات سشن‌های خودش، batch=1) ؛ shared: یک نسخه از مدل‌ها برای همه
+    configs = (("per_robot", robots, 1), ("shared_batch1", 1, 1), ("shared_micro_batch", 1, robots))
+    results = {"robots": robots, "cores": os.cpu_count()}
+    ctx = multiprocessing.get_context("spawn")
+    for label, copies, max_batch in configs:
+        with ctx.Pool(1) as pool:
+            results[label] = pool.apply(_run_config, (model_paths, robots, copies, max_batch,
+                                                      seconds, max_latency))
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python -m modules.module2_vision.inference_server yolo.onnx midas.onnx [robots] [seconds]")
+        sys.exit(1)
+    robots = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 5.0
+    for label, result in benchmark(sys.argv[1:3], robots, seconds).items():
+        print(f"{label:<18} {result}")
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+from modules.module2_vision.inference import dummy_feed, session_options
+
+
+# =====================
+# مدیریت مدل‌ها: کش گراف بهینه‌شده (بر اساس هش مدل + provider)، سشن تنبل و گرم کردن
+# =====================
+class ModelManager:
+    def __init__(self, cache_dir="model_cache", providers=None, intra_op_num_threads=0,
+                 inter_op_num_threads=1, warmup_runs=2):
+        self.cache_dir = cache_dir
+        self.providers = providers or ['CPUExecutionProvider']
+        self.intra_op_num_threads = intra_op_num_threads
+        self.inter_op_num_threads = inter_op_num_threads
+        self.warmup_runs = warmup_runs
+        self.models = {}     # name -> (path, export)
+        self.sessions = {}
+        self.input_names = {}
+        self.report = {}     # name -> زمان‌های بارگذاری و گرم کردن (ms)
+        self._locks = {}
+
+    def register(self, name, path, export=None):
+        # export(path) فقط وقتی صدا زده می‌شود که فایل مدل وجود نداشته باشد
+        self.models[name] = (path, export)
+        self._locks[name] = threading.Lock()
+
+    @property
+    def provider(self):
+        # اولین provider درخواستی که واقعاً در این نصب onnxruntime موجود است
+        available = ort.get_available_providers()
+        return next((p for p in self.providers if p in available), 'CPUExecutionProvider')
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "hashes.json")
+
+    def model_hash(self, path):
+        # هش فایل فقط با تغییر اندازه/زمان تغییر دوباره حساب می‌شود (مدل‌ها ده‌ها مگابایت‌اند)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        entry = index.get(os.path.abspath(path))
+        if entry and entry["stamp"] == stamp:
+            return entry["sha256"]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        index[os.path.abspath(path)] = {"stamp": stamp, "sha256": digest}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_path())
+        return digest
+
+    def cache_path(self, path):
+        # گراف بهینه‌شده ممکن است به سخت‌افزار وابسته باشد؛ معماری هم در کلید است
+        stem = os.path.splitext(os.path.basename(path))[0]
+        provider = self.provider.replace("ExecutionProvider", "").lower()
+        key = f"{self.model_hash(path)[:16]}.{provider}.{platform.machine()}"
+        return os.path.join(self.cache_dir, f"{stem}.{key}.onnx")
+
+    def session(self, name):
+        sess = self.sessions.get(name)
+        if sess is not None:
+            return sess
+        with self._locks[name]:
+            if name not in self.sessions:
+                self._load(name)
+        return self.sessions[name]
+
+    def _load(self, name):
+        path, export = self.models[name]
+        report = self.report.setdefault(name, {})
+        if not os.path.exists(path):
+            if export is None:
+                raise FileNotFoundError(path)
+            t0 = time.perf_counter()
+            export(path)
+            report["export_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        t0 = time.perf_counter()
+        cached = self.cache_path(path)
+        sess = None
+        if os.path.exists(cached):
+            # گراف از قبل بهینه شده است؛ دوباره بهینه‌سازی نمی‌شود
+            opts = session_options(self.intra_op_num_threads, self.inter_op_num_threads)
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            try:
+                sess = self._open(cached, opts)
+                report["cache"] = "hit"
+            except Exception as e:
+                # فایل کش خراب یا نیمه‌نوشته: حذف و ساخت دوباره از مدل اصلی
+                print(f"⚠️ {name}: cached graph unusable ({e}); rebuilding")
+                os.remove(cached)
+                report["cache"] = "rebuilt"
+        if sess is None:
+            sess = self._build(path, cached)
+            report.setdefault("cache", "miss")
+        report["load_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        self.input_names[name] = sess.get_inputs()[0].name
+        self.sessions[name] = sess
+
+    def _open(self, source, opts):
+        # CPU به عنوان پشتیبان فقط وقتی provider چیز دیگری است (ORT برای provider تکراری هشدار می‌دهد)
+        providers = [self.provider]
+        if self.provider != 'CPUExecutionProvider':
+            providers.append('CPUExecutionProvider')
+        return ort.InferenceSession(source, sess_options=opts, providers=providers)
+
+    def _build(self, path, cached):
+        # ORT گراف بهینه‌شده را در حین ساخت سشن می‌نویسد؛ اول در فایل موقت، بعد os.replace
+        # تا قطع برق وسط نوشتن هرگز فایل کش ناقص باقی نگذارد
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".onnx", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            opts = session_options(self.intra_op_num_threads, self.inter_op_num_threads)
+            opts.optimized_model_filepath = tmp
+            sess = self._open(path, opts)
+            os.replace(tmp, cached)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return sess
+
+    def input_name(self, name):
+        self.session(name)
+        return self.input_names[name]
+
+    def warmup(self, names=None, runs=None):
+        # قبل از شروع حلقه‌ی کنترل: بارگذاری + اجرای اول (تخصیص حافظه) روی ورودی ساختگی
+        runs = self.warmup_runs if runs is None else runs
+        for name in names or list(self.models):
+            sess = self.session(name)
+            report = self.report[name]
+            feed = dummy_feed(sess)
+            times = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                sess.run(None, feed)
+                times.append((time.perf_counter() - t0) * 1000)
+            if times:
+                report["first_run_ms"] = round(times[0], 1)
+            if len(times) > 1:
+                report["warm_run_ms"] = round(float(np.median(times[1:])), 1)
+        return self.report
+
+    def close(self):
+        self.sessions.clear()
+
+
+# =====================
+# زمان راه‌اندازی سرد (کش خالی) در برابر گرم (کش پر) تا اولین استنتاج
+# python -m modules.module2_vision.model_manager yolo11n.onnx midas_small.onnx
+# =====================
+def _startup(paths, cache_dir):
+    manager = ModelManager(cache_dir, warmup_runs=3)
+    for i, path in enumerate(paths):
+        manager.register(f"m{i}", path)
+    t0 = time.perf_counter()
+    manager.warmup()
+    total = round((time.perf_counter() - t0) * 1000, 1)
+    return {"total_ms": total, "models": manager.report}
+
+
+def benchmark(paths):
+    cache_dir = tempfile.mkdtemp(prefix="model_cache_")
+    try:
+        return {"cold": _startup(paths, cache_dir), "warm": _startup(paths, cache_dir)}
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m modules.module2_vision.model_manager model.onnx [model.onnx ...]")
+        sys.exit(1)
+    for name, result in benchmark(sys.argv[1:]).items():
+        print(f"{name:<5} {result}")
@@ -1 +1,148 @@
+import cv2
+import numpy as np
 
+
+# =====================
+# هندسه مسیر (تراپزوئید)
+# =====================
+def trapezoid_points(angle, W, H, top=90):
+    offset = int((angle / 30.0) * W * 0.28)
+    return np.array([
+        [W//2 - 20 + offset, top],
+        [W//2 + 20 + offset, top],
+        [W//2 + 70 + offset, H],
+        [W//2 - 70 + offset, H]
+    ], dtype=np.int32)
+
+
+def trapezoid_mask(angle, W, H):
+    mask = np.zeros((H, W), dtype=np.uint8)
+    pts = trapezoid_points(angle, W, H)
+    cv2.fillPoly(mask, [pts], 255)
+    return mask, pts
+
+
+# =====================
+# بانک ماسک‌ها (یک بار برای هر W, H, ANGLES ساخته می‌شود)
+# =====================
+class MaskBank:
+    def __init__(self, W, H, angles):
+        self.key = None
+        self.ensure(W, H, angles)
+
+    def ensure(self, W, H, angles):
+        key = (W, H, tuple(angles))
+        if key != self.key:
+            self._build(*key)
+        return self
+
+    def _build(self, W, H, angles):
+        self.key = (W, H, angles)
+        self.W, self.H = W, H
+        self.angles = angles
+        self.points = []
+        self.indices = []  # اندیس‌های تخت (flat) پیکسل‌های هر ماسک
+        for a in angles:
+            mask, pts = trapezoid_mask(a, W, H)
+            self.points.append(pts)
+            self.indices.append(np.flatnonzero(mask))
+        self.counts = np.array([len(idx) for idx in self.indices], dtype=np.int64)
+
+        # اجتماع ماسک‌ها و مستطیل دربرگیرنده‌ی آن (x0, y0, x1, y1)
+        self.union_mask = np.zeros((H, W), dtype=bool)
+        for idx in self.indices:
+            self.union_mask.ravel()[idx] = True
+        ys, xs = np.nonzero(self.union_mask)
+        if len(xs):
+            self.bbox = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+        else:
+            self.bbox = None
+
+
+# =====================
+# موتور هزینه چندزاویه‌ای (همه زاویه‌ها در یک ضرب ماتریسی)
+# =====================
+class PathCostEngine:
+    def __init__(self, bank, shadow_th=35):
+        self.bank = bank
+        self.shadow_th = shadow_th
+        self.key = None
+
+    def _prepare(self):
+        bank = self.bank
+        if bank.key == self.key:
+            return
+        # اجتماع پیکسل‌های همه ماسک‌ها؛ هر سطر وزن میانگین یک زاویه است
+        if bank.indices:
+            self.union = np.unique(np.concatenate(bank.indices))
+        else:
+            self.union = np.empty(0, dtype=np.int64)
+        self.weights = np.zeros((len(bank.angles), len(self.union)), dtype=np.float32)
+        for row, idx in zip(self.weights, bank.indices):
+            if len(idx):
+                row[np.searchsorted(self.union, idx)] = 1.0 / len(idx)
+        self.empty = bank.counts == 0
+        self.planes = np.empty((2, len(self.union)), dtype=np.float32)
+        self.key = bank.key
+
+    def region_means(self, *planes):
+        # خروجی: (تعداد زاویه‌ها، تعداد صفحه‌ها) میانگین هر صفحه داخل هر ماسک
+        self._prepare()
+        stacked = self.planes[:len(planes)]
+        for row, plane in zip(stacked, planes):
+            row[:] = plane.ravel()[self.union]
+        return self.weights @ stacked.T
+
+    def score(self, mag, edges, brightness_diff):
+        # brightness_diff از آمار FrameHistory می‌آید (مرجع منهای فریم جاری برای هر ناحیه)
+        means = self.region_means(mag, edges).astype(np.float64)
+        f_mean = means[:, 0]
+        e_density = means[:, 1] / 255.0
+
+        is_shadow = (brightness_diff > self.shadow_th) & (e_density < 0.04)
+        is_passable = (f_mean < 0.7) & (e_density < 0.07)
+
+        costs = np.where(is_shadow | is_passable, 0.15,
+                         np.minimum(1.0, (f_mean * 0.4) + (e_density * 3.5)))
+        costs[self.empty] = 1.0
+        return np.round(costs, 3)
+
+
+# =====================
+# جستجوی پنجره‌ی هم‌عرض ربات روی خط هزینه (جمع تجمعی؛ همه‌ی آفست‌ها یک‌جا)
+# =====================
+def window_costs(cost_line, robot_width, stride=1, center_bias=0.2):
+    # خروجی: مرکز هر پنجره و هزینه‌ی کل آن (میانگین + جریمه‌ی فاصله از وسط)
+    n = len(cost_line)
+    csum = np.zeros(n + 1)
+    np.cumsum(cost_line, out=csum[1:])
+    # همان آفست‌های حلقه‌ی قبلی (range(0, n - robot_width, stride))؛ ربات هم‌عرض یا پهن‌تر از خط -> هیچ پنجره‌ای
+    offsets = np.arange(0, n - robot_width, stride)
+    means = (csum[offsets + robot_width] - csum[offsets]) / robot_width
+    centers = offsets + robot_width // 2
+    bias = np.abs(centers - n // 2) / n
+    return centers, means + bias * center_bias
+
+
+def best_window(cost_line, robot_width, stride=1, center_bias=0.2):
+    centers, totals = window_costs(cost_line, robot_width, stride, center_bias)
+    if not len(totals):
+        # همان مقدار اولیه‌ی حلقه‌ی قبلی: هزینه‌ی 100 (عقب) و هدف وسط تصویر
+        return 100.0, len(cost_line) // 2, (centers, totals)
+    i = int(np.argmin(totals))  # اولین کمینه، مثل مقایسه‌ی اکید حلقه‌ی قبلی
+    return float(totals[i]), int(centers[i]), (centers, totals)
+
+
+# =====================
+# جریمه‌ی جعبه‌های مانع روی خط هزینه (آرایه‌ی تفاضلی؛ یک پخش برداری برای همه‌ی جعبه‌ها)
+# =====================
+def apply_box_penalties(cost_line, x1, x2, penalty=0.5):
+    n = len(cost_line)
+    lo = np.clip(np.asarray(x1).astype(np.int64), 0, n)
+    hi = np.clip(np.asarray(x2).astype(np.int64), 0, n)
+    valid = hi > lo
+    diff = np.zeros(n + 1, dtype=np.float64)
+    np.add.at(diff, lo[valid], penalty)
+    np.add.at(diff, hi[valid], -penalty)
+    cost_line += np.cumsum(diff[:-1]).astype(cost_line.dtype)
+    return cost_line
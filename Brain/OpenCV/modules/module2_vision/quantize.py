@@ -0,0 +1,135 @@
+import glob
+import importlib.util
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+QUANT_MODES = ("static", "dynamic")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def quantized_path(path, mode="static"):
+    # yolo11n.onnx -> yolo11n.int8-static.onnx
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.int8-{mode}{ext}"
+
+
+# =====================
+# فریم‌های محلی برای کالیبراسیون و مقایسه (پوشه‌ی تصاویر یا فایل ویدیو/MJPEG ضبط‌شده)
+# =====================
+def load_frames(source, limit=64):
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "*"))
+                       if p.lower().endswith(IMAGE_EXTS))
+        if len(paths) > limit:
+            paths = [paths[i] for i in np.linspace(0, len(paths) - 1, limit).astype(int)]
+        frames = [cv2.imread(p) for p in paths]
+        return [f for f in frames if f is not None]
+
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    if len(frames) > limit:
+        frames = [frames[i] for i in np.linspace(0, len(frames) - 1, limit).astype(int)]
+    return frames
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    # prepare(frame) -> تنسور ورودی مدل (همان پیش‌پردازش زمان اجرا تا بازه‌ها درست کالیبره شوند)
+    # input_name=None یعنی از خود مدل خوانده شود (quantize_model)
+    def __init__(self, frames, prepare, input_name=None):
+        self.frames = frames
+        self.input_name = input_name
+        self.prepare = prepare
+        self.rewind()
+
+    def get_next(self):
+        frame = next(self._iter, None)
+        if frame is None:
+            return None
+        # ModelInput بافرش را بازنویسی می‌کند؛ اینجا کپی لازم است
+        return {self.input_name: np.array(self.prepare(frame), copy=True)}
+
+    def rewind(self):
+        self._iter = iter(self.frames)
+
+
+# =====================
+# ساخت نسخه‌ی INT8 (ایستا با کالیبراسیون یا پویا فقط روی وزن‌ها)
+# =====================
+def quantize_model(src, dst, mode="static", reader=None, per_channel=True, nodes_to_exclude=None):
+    if mode not in QUANT_MODES:
+        raise ValueError(f"unknown quantization mode: {mode}")
+    if mode == "static" and reader is None:
+        raise ValueError("static quantization needs a calibration reader")
+
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        # استنتاج شکل‌ها + بهینه‌سازی پایه، طبق توصیه‌ی onnxruntime قبل از کوانتیزه کردن
+        prepared = os.path.join(tmp, "prepared.onnx")
+        # استنتاج نمادین شکل‌ها به sympy نیاز دارد (معمولاً همراه torch نصب است)
+        quant_pre_process(src, prepared, skip_symbolic_shape=importlib.util.find_spec("sympy") is None)
+        if mode == "static":
+            if reader.input_name is None:
+                reader.input_name = onnx.load(prepared).graph.input[0].name
+            # QDQ: فعال‌سازی‌ها uint8، وزن‌ها int8 (در صورت امکان برای هر کانال)
+            quantize_static(prepared, dst, reader, quant_format=QuantFormat.QDQ,
+                            per_channel=per_channel, activation_type=QuantType.QUInt8,
+                            weight_type=QuantType.QInt8, nodes_to_exclude=nodes_to_exclude)
+        else:
+            quantize_dynamic(prepared, dst, per_channel=per_channel, weight_type=QuantType.QInt8,
+                             nodes_to_exclude=nodes_to_exclude)
+    return {"src_mb": round(os.path.getsize(src) / 2**20, 2),
+            "dst_mb": round(os.path.getsize(dst) / 2**20, 2),
+            "seconds": round(time.perf_counter() - t0, 1)}
+
+
+# =====================
+# مقایسه‌ی دو نسخه روی فریم‌های ضبط‌شده: تأخیر، تطابق تصمیم و فاصله‌ی خط هزینه
+# run(frame) -> (decision, cost_line)
+# =====================
+def compare(reference, candidate, frames, warmup=2):
+    if not frames:
+        raise ValueError("compare needs at least one frame (empty calibration/replay source?)")
+    for frame in frames[:warmup]:
+        reference(frame)
+        candidate(frame)
+
+    results = {}
+    for name, run in (("reference", reference), ("candidate", candidate)):
+        times, decisions, lines = [], [], []
+        for frame in frames:
+            t0 = time.perf_counter()
+            decision, cost_line = run(frame)
+            times.append((time.perf_counter() - t0) * 1000)
+            decisions.append(decision)
+            lines.append(np.array(cost_line, dtype=np.float64, copy=True))
+        p50, p95 = np.percentile(times, [50, 95])
+        results[name] = {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+                         "decisions": decisions, "lines": np.stack(lines)}
+
+    ref, cand = results["reference"], results["candidate"]
+    err = np.abs(cand.pop("lines") - ref.pop("lines"))
+    same = [a == b for a, b in zip(ref["decisions"], cand["decisions"])]
+    return {
+        "frames": len(frames),
+        "reference": {k: v for k, v in ref.items() if k != "decisions"},
+        "candidate": {k: v for k, v in cand.items() if k != "decisions"},
+        "speedup": round(ref["p50_ms"] / cand["p50_ms"], 2) if cand["p50_ms"] else None,
+        "decision_agreement": round(float(np.mean(same)), 3) if same else None,
+        "changed_frames": [i for i, s in enumerate(same) if not s],
+        "cost_line_mae": round(float(err.mean()), 4) if err.size else None,
+        "cost_line_max_err": round(float(err.max()), 4) if err.size else None,
+    }
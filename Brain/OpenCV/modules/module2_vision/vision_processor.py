@@ -1 +1,220 @@
+import sys
+import time
+import tracemalloc
 
+import cv2
+import numpy as np
+
+FARNEBACK_DEFAULTS = dict(pyr_scale=0.5, levels=3, winsize=15, iterations=3,
+                          poly_n=5, poly_sigma=1.2, flags=0)
+LK_DEFAULTS = dict(grid_step=8, winSize=(15, 15), maxLevel=2)
+
+
+# =====================
+# بافرهای کاری از پیش تخصیص‌یافته (برای خروجی dst= در OpenCV)
+# =====================
+class BufferPool:
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype=np.float32):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.zeros(shape, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
+
+    def nbytes(self):
+        return sum(b.nbytes for b in self.buffers.values())
+
+
+def flow_magnitude(flow, pool, name="mag"):
+    # فقط اندازه (بدون زاویه) و بدون آرایه‌ی موقت: sqrt(fx^2 + fy^2)
+    sq = pool.get(name + "_sq", flow.shape)
+    mag = pool.get(name, flow.shape[:2])
+    np.multiply(flow, flow, out=sq)
+    np.add(sq[..., 0], sq[..., 1], out=mag)
+    np.sqrt(mag, out=mag)
+    return mag
+
+
+def canny(gray, pool, low=50, high=150):
+    edges = pool.get("edges", gray.shape, np.uint8)
+    return cv2.Canny(gray, low, high, edges=edges)
+
+
+# =====================
+# محاسبه Optical Flow (کل فریم / فقط ROI ماسک‌ها / Lucas-Kanade روی شبکه نقاط)
+# =====================
+class FlowEstimator:
+    MODES = ("full", "roi", "lk")
+
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else BufferPool()
+        self.mag = None
+        self.mag_key = None
+        self.grid_key = None
+
+    def compute(self, prev, gray, bank, mode="full", scale=1.0, farneback=None, lk=None):
+        # خروجی: نقشه‌ی magnitude هم‌اندازه‌ی فریم و میانگین آن روی ناحیه‌ی محاسبه‌شده
+        # (آرایه‌ی خروجی از pool است و در فریم بعدی بازنویسی می‌شود)
+        if mode not in self.MODES:
+            raise ValueError(f"unknown flow mode: {mode}")
+        if mode == "full" or bank.bbox is None:
+            mag = self._farneback(prev, gray, scale, farneback or FARNEBACK_DEFAULTS)
+            return mag, float(cv2.mean(mag)[0])
+
+        # بیرون از ROI صفر می‌ماند؛ فقط با تغییر اندازه/حالت/ROI دوباره صفر می‌شود
+        key = (gray.shape, mode, bank.bbox)
+        if key != self.mag_key:
+            self.mag = np.zeros(gray.shape, dtype=np.float32)
+            self.mag_key = key
+
+        x0, y0, x1, y1 = bank.bbox
+        if mode == "roi":
+            # کپی ROI در بافر پیوسته تا OpenCV خودش کپی موقت نسازد
+            roi_prev = self.pool.get("roi_prev", (y1 - y0, x1 - x0), np.uint8)
+            roi_gray = self.pool.get("roi_gray", (y1 - y0, x1 - x0), np.uint8)
+            np.copyto(roi_prev, prev[y0:y1, x0:x1])
+            np.copyto(roi_gray, gray[y0:y1, x0:x1])
+            mag = self._farneback(roi_prev, roi_gray, scale, farneback or FARNEBACK_DEFAULTS)
+            self.mag[y0:y1, x0:x1] = mag
+            return self.mag, float(cv2.mean(mag)[0])
+
+        return self._lucas_kanade(prev, gray, bank, lk or LK_DEFAULTS)
+
+    def _farneback(self, prev, gray, scale, params):
+        pool = self.pool
+        h, w = gray.shape
+        if scale != 1.0:
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            prev = cv2.resize(prev, size, dst=pool.get("small_prev", size[::-1], np.uint8),
+                              interpolation=cv2.INTER_AREA)
+            gray = cv2.resize(gray, size, dst=pool.get("small_gray", size[::-1], np.uint8),
+                              interpolation=cv2.INTER_AREA)
+        flow = pool.get("flow", gray.shape + (2,))
+        flow = cv2.calcOpticalFlowFarneback(prev, gray, flow, **params)
+        if scale == 1.0:
+            return flow_magnitude(flow, pool)
+        # جابجایی‌ها در رزولوشن پایین‌ترند؛ به واحد پیکسل فریم اصلی برمی‌گردند
+        mag = cv2.resize(flow_magnitude(flow, pool, "small_mag"), (w, h),
+                         dst=pool.get("mag", (h, w)), interpolation=cv2.INTER_LINEAR)
+        np.multiply(mag, 1.0 / scale, out=mag)
+        return mag
+
+    def _prepare_grid(self, bank, step):
+        key = (bank.key, step)
+        if key == self.grid_key:
+            return
+        x0, y0, x1, y1 = bank.bbox
+        gy, gx = np.mgrid[y0:y1:step, x0:x1:step]
+        inside = bank.union_mask[gy, gx]
+        self.grid_shape = gy.shape
+        self.grid_inside = inside
+        self.grid_points = np.stack([gx[inside], gy[inside]], axis=1).astype(np.float32).reshape(-1, 1, 2)
+        self.grid_values = np.zeros(gy.shape, dtype=np.float32)
+        self.grid_key = key
+
+    def _lucas_kanade(self, prev, gray, bank, params):
+        params = dict(params)
+        self._prepare_grid(bank, params.pop("grid_step"))
+        x0, y0, x1, y1 = bank.bbox
+        if not len(self.grid_points):
+            return self.mag, 0.0
+
+        nxt, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, self.grid_points, None, **params)
+        disp = np.linalg.norm((nxt - self.grid_points).reshape(-1, 2), axis=1)
+        tracked = status.ravel() == 1
+        mean = float(disp[tracked].mean()) if tracked.any() else 0.0
+        # نقاط گم‌شده و نقاط بیرون از ماسک‌ها با میانگین پر می‌شوند
+        disp[~tracked] = mean
+        self.grid_values.fill(mean)
+        self.grid_values[self.grid_inside] = disp
+        self.mag[y0:y1, x0:x1] = cv2.resize(self.grid_values, (x1 - x0, y1 - y0),
+                                            dst=self.pool.get("lk_mag", (y1 - y0, x1 - x0)),
+                                            interpolation=cv2.INTER_LINEAR)
+        return self.mag, mean
+
+
+# =====================
+# دیکد خروجی YOLO (فیلتر اطمینان، بیشینه‌ی کلاس، تبدیل جعبه و NMS به صورت برداری)
+# =====================
+def decode_yolo(preds, conf_th=0.4, iou_th=0.45, classes=None, ratio=(1.0, 1.0), pad=(0.0, 0.0)):
+    # preds: (N, 4 + تعداد کلاس) = cx, cy, w, h + امتیاز هر کلاس (YOLOv8/11 بدون objectness)
+    # خروجی: جعبه‌ها (K, 4) به صورت x1, y1, x2, y2 در مختصات تصویر اصلی، اطمینان و کلاس
+    rows = preds.T  # خروجی خام مدل (4 + کلاس, N) پیوسته است؛ کاهش روی محور پیوسته سریع‌تر است
+    scores = rows[4:]
+    class_ids = np.arange(scores.shape[0])
+    if classes is not None:
+        class_ids = np.asarray(classes)
+        scores = scores[class_ids]
+    conf = scores.max(axis=0)
+    keep = np.flatnonzero(conf > conf_th)
+    if not len(keep):
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int64)
+
+    cx, cy, w, h = rows[:4, keep]
+    conf, cls = conf[keep], class_ids[scores[:, keep].argmax(axis=0)]
+    # NMS بدون توجه به کلاس: هر مانع فقط یک بار جریمه می‌شود
+    tl_boxes = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+    idx = np.asarray(cv2.dnn.NMSBoxes(tl_boxes.tolist(), conf.tolist(), conf_th, iou_th), dtype=np.int64).ravel()
+
+    x1 = (cx[idx] - w[idx] / 2 - pad[0]) / ratio[0]
+    y1 = (cy[idx] - h[idx] / 2 - pad[1]) / ratio[1]
+    x2 = (cx[idx] + w[idx] / 2 - pad[0]) / ratio[0]
+    y2 = (cy[idx] + h[idx] / 2 - pad[1]) / ratio[1]
+    return np.stack([x1, y1, x2, y2], axis=1), conf[idx], cls[idx]
+
+
+# =====================
+# میکروبنچمارک تخصیص حافظه در هر فریم (قبل و بعد از BufferPool)
+# python -m modules.module2_vision.vision_processor [frames]
+# =====================
+def _legacy_step(prev, frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    flow = cv2.calcOpticalFlowFarneback(prev, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    mag, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    edges = cv2.Canny(gray, 50, 150)
+    return gray, mag, edges
+
+
+def _pooled_step(prev, frame, pool, flow_estimator):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.get("gray", frame.shape[:2], np.uint8))
+    mag = flow_estimator._farneback(prev, gray, 1.0, FARNEBACK_DEFAULTS)
+    edges = canny(gray, pool)
+    return gray, mag, edges
+
+
+def _measure(step, frames, prev):
+    step(prev, frames[0])  # گرم کردن و پر کردن pool
+    tracemalloc.start()
+    peaks = []
+    t0 = time.perf_counter()
+    for frame in frames:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step(prev, frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    dt = time.perf_counter() - t0
+    tracemalloc.stop()
+    return {"alloc_kb_per_frame": round(float(np.mean(peaks)) / 1024, 1),
+            "ms_per_frame": round(dt / len(frames) * 1000, 2)}
+
+
+def benchmark(n_frames=50, W=320, H=240):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (H, W, 3), dtype=np.uint8) for _ in range(n_frames)]
+    prev = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
+    pool = BufferPool()
+    estimator = FlowEstimator(pool)
+    return {
+        "before": _measure(_legacy_step, frames, prev),
+        "after": _measure(lambda p, f: _pooled_step(p, f, pool, estimator), frames, prev),
+        "pool_kb": round(pool.nbytes() / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for name, result in benchmark(n).items():
+        print(f"{name:<7} {result}")
@@ -1 +1,73 @@
+import time
 
+# فرمان‌های ایمنی هیچ‌وقت ادغام یا محدود نمی‌شوند
+SAFETY_COMMANDS = frozenset({"stop", "backward", "turn_right_180"})
+
+
+# =====================
+# ارسال‌کننده‌ی فرمان: حذف تکراری‌ها + محدودیت نرخ + نگه‌داشتن فقط آخرین تصمیم
+# =====================
+class CommandEmitter:
+    def __init__(self, max_rate=10.0, value_tolerance=0.05, repeat_interval=1.0):
+        self.max_rate = max_rate            # حداکثر فرمان در ثانیه (0 = بدون محدودیت)
+        self.value_tolerance = value_tolerance
+        self.repeat_interval = repeat_interval  # فرمان تکراری بعد از این مدت دوباره فرستاده می‌شود
+        self.last = None
+        self.last_time = float("-inf")
+        self.pending = None
+        self.stats = {"offered": 0, "emitted": 0, "coalesced": 0,
+                      "superseded": 0, "safety": 0}
+
+    @property
+    def min_interval(self):
+        return 1.0 / self.max_rate if self.max_rate else 0.0
+
+    def _same_as_last(self, command):
+        return (self.last is not None
+                and command["cmd"] == self.last["cmd"]
+                and abs(command["val"] - self.last["val"]) <= self.value_tolerance)
+
+    def _emit(self, command, now):
+        self.last = command
+        self.last_time = now
+        self.pending = None
+        self.stats["emitted"] += 1
+        return command
+
+    def offer(self, command, now=None):
+        # خروجی: فرمانی که همین الان باید فرستاده شود یا None
+        now = time.monotonic() if now is None else now
+        self.stats["offered"] += 1
+
+        if command["cmd"] in SAFETY_COMMANDS:
+            self.stats["safety"] += 1
+            return self._emit(command, now)
+
+        if self._same_as_last(command) and now - self.last_time < self.repeat_interval:
+            # تصمیم تازه همان فرمان قبلی است؛ فرمان منتظر قبلی دیگر لازم نیست
+            if self.pending is not None:
+                self.stats["superseded"] += 1
+                self.pending = None
+            self.stats["coalesced"] += 1
+            return None
+
+        if now - self.last_time < self.min_interval:
+            if self.pending is not None:
+                self.stats["superseded"] += 1
+            self.pending = command
+            return None
+
+        return self._emit(command, now)
+
+    def time_until_due(self, now=None):
+        if self.pending is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.last_time + self.min_interval - now)
+
+    def poll(self, now=None):
+        # فرمان منتظر وقتی که مهلت نرخ تمام شود فرستاده می‌شود
+        now = time.monotonic() if now is None else now
+        if self.pending is not None and now - self.last_time >= self.min_interval:
+            return self._emit(self.pending, now)
+        return None
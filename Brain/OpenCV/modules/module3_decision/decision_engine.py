@@ -1 +1,43 @@
+import numpy as np
 
+
+# =====================
+# فیلتر زمانی هزینه‌ی زاویه‌ها (EMA یا میانه‌ی پنجره‌ای) روی آرایه‌های ثابت NumPy
+# =====================
+class TemporalCostFilter:
+    MODES = ("ema", "median")
+
+    def __init__(self, n_angles, mode="ema", alpha=0.35, window=15):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown filter mode: {mode}")
+        self.mode = mode
+        self.alpha = alpha
+        self.window = window
+        self.resize(n_angles)
+
+    def resize(self, n_angles):
+        self.n_angles = n_angles
+        self.state = np.zeros(n_angles)
+        self.ring = np.zeros((self.window, n_angles))
+        self.head = 0
+        self.count = 0
+
+    def reset(self):
+        self.resize(self.n_angles)
+
+    def update(self, costs):
+        costs = np.asarray(costs, dtype=np.float64)
+        if len(costs) != self.n_angles:
+            self.resize(len(costs))
+
+        self.ring[self.head] = costs
+        self.head = (self.head + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+
+        if self.mode == "median":
+            np.median(self.ring[:self.count], axis=0, out=self.state)
+        elif self.count == 1:
+            self.state[:] = costs
+        else:
+            self.state += self.alpha * (costs - self.state)
+        return self.state
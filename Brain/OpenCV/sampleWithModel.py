@@ -1,52 +1,147 @@
 import cv2
 import asyncio
 import numpy as np
-import onnxruntime as ort
-import torch
-from ultralytics import YOLO
-import os, time
+import json, os, sys, time
+
+from modules.module2_vision.path_analyzer import apply_box_penalties, best_window
+from modules.module2_vision.vision_processor import decode_yolo
+from modules.module2_vision.inference import InferenceScheduler, RefreshGate, motion_thumbnail, threads_per_model
+from modules.module2_vision.model_manager import ModelManager
+from modules.module2_vision.quantize import (FrameCalibrationReader, compare, load_frames,
+                                              quantize_model, quantized_path)
+from modules.module1_stream.preprocessor import ModelInput
+from utils.renderer import FrameRenderer
+from utils.metrics import StageLatency
 
 # --- تنظیمات ابعاد ---
 std_w, std_h = 640, 480 
+WINDOW_STRIDE = 15  # گام جستجوی پنجره (1 = همه‌ی آفست‌ها)
+YOLO_CONF, YOLO_IOU = 0.4, 0.45
+YOLO_CLASSES = None  # None = همه‌ی کلاس‌ها مانع حساب می‌شوند؛ مثلا [0] فقط انسان
+YOLO_LETTERBOX = True  # حفظ نسبت ابعاد با حاشیه‌ی خاکستری (مثل آموزش YOLO) به جای کشیدن تصویر
+RENDER_FPS = 5.0  # نرخ رندر دیباگ (مستقل از نرخ تصمیم‌گیری)
+renderer = None  # با start_renderer() فعال می‌شود؛ پیش‌فرض بدون رندر (headless)
+latency = StageLatency()  # تأخیر هر مرحله (yolo، midas، decide)
 
-async def setup_models():
-    if not os.path.exists("yolo11n.onnx"):
-        print("📥 Exporting YOLO...")
-        YOLO("yolo11n.pt").export(format="onnx", imgsz=640)
-    
-    if not os.path.exists("midas_small.onnx"):
-        print("📥 Exporting MiDaS...")
-        midas = torch.hub.load("intel-isl/MiDaS", "MiDaS_small").cpu()
-        midas.eval()
-        # اینجا نام ورودی را عمداً 'x' می‌گذاریم تا با سخت‌گیرترین حالت سازگار باشد
-        torch.onnx.export(midas, torch.randn(1, 3, 256, 256), "midas_small.onnx", 
-                          opset_version=11, input_names=['x'])
-
-# اجرای دانلود/تبدیل قبل از تعریف سشن‌ها
-if not os.path.exists("yolo11n.onnx") or not os.path.exists("midas_small.onnx"):
-    import nest_asyncio
-    nest_asyncio.apply()
-    asyncio.run(setup_models())
-
-# لود کردن سشن‌ها
+def export_yolo(path):
+    from ultralytics import YOLO
+    print("📥 Exporting YOLO...")
+    # ultralytics کنار فایل .pt می‌نویسد؛ خروجی به مسیر خواسته‌شده منتقل می‌شود
+    # dynamic=True تا سرور استنتاج چند ربات را در یک batch اجرا کند (inference_server)
+    exported = YOLO("yolo11n.pt").export(format="onnx", imgsz=640, dynamic=True)
+    # فقط بعد batch پویا می‌ماند؛ ابعاد تصویر ثابت می‌شوند تا گرم کردن و کالیبراسیون شکل درست داشته باشند
+    import onnx
+    model = onnx.load(exported)
+    dims = model.graph.input[0].type.tensor_type.shape.dim
+    dims[2].dim_value = dims[3].dim_value = 640
+    onnx.save(model, path)
+    if os.path.abspath(exported) != os.path.abspath(path):
+        os.remove(exported)
+
+def export_midas(path):
+    import torch
+    print("📥 Exporting MiDaS...")
+    midas = torch.hub.load("intel-isl/MiDaS", "MiDaS_small").cpu()
+    midas.eval()
+    # اینجا نام ورودی را عمداً 'x' می‌گذاریم تا با سخت‌گیرترین حالت سازگار باشد
+    # بعد batch پویا برای micro-batch چند رباته
+    torch.onnx.export(midas, torch.randn(1, 3, 256, 256), path, 
+                      opset_version=11, input_names=['x'], output_names=['depth'],
+                      dynamic_axes={'x': {0: 'batch'}, 'depth': {0: 'batch'}})
+
+# تنسورهای ورودی از پیش تخصیص‌یافته (هر مدل بافر خودش را دارد چون موازی اجرا می‌شوند)
+base_img = np.zeros((std_h, std_w, 3), dtype=np.uint8)
+yolo_input = ModelInput((640, 640), letterbox=YOLO_LETTERBOX)
+midas_input = ModelInput((256, 256))
+
+# --- دقت مدل‌ها ---
+# "fp32" یا "int8"؛ نسخه‌ی INT8 اگر وجود نداشته باشد یک بار از fp32 ساخته می‌شود
+PRECISION = "fp32"
+INT8_MODE = "static"  # "static" (با کالیبراسیون، سریع‌تر روی CPU) یا "dynamic" (فقط وزن‌ها)
+CALIBRATION_SOURCE = "calibration"  # پوشه‌ی فریم‌ها یا ویدیو/MJPEG ضبط‌شده از دوربین ربات
+CALIBRATION_FRAMES = 64
+INT8_EXCLUDE = {"yolo": None, "midas": None}  # نام نودهایی که fp32 بمانند (مثلاً سر تشخیص YOLO)
+
+MODEL_FILES = {"yolo": "yolo11n.onnx", "midas": "midas_small.onnx"}
+EXPORTERS = {"yolo": export_yolo, "midas": export_midas}
+# همان پیش‌پردازش زمان اجرا برای کالیبراسیون
+PREPARE = {
+    "yolo": lambda frame: yolo_input.fill(cv2.resize(frame, (std_w, std_h))),
+    "midas": lambda frame: midas_input.fill(cv2.resize(frame, (std_w, std_h))),
+}
+
+def int8_export(name, mode):
+    def export(path):
+        src = MODEL_FILES[name]
+        if not os.path.exists(src):
+            EXPORTERS[name](src)
+        reader = None
+        if mode == "static":
+            frames = load_frames(CALIBRATION_SOURCE, CALIBRATION_FRAMES)
+            if not frames:
+                raise FileNotFoundError(f"no calibration frames in {CALIBRATION_SOURCE}")
+            reader = FrameCalibrationReader(frames, PREPARE[name])
+        print(f"📥 Quantizing {name} ({mode})...")
+        print(f"✅ {name}: {quantize_model(src, path, mode, reader, nodes_to_exclude=INT8_EXCLUDE[name])}")
+    return export
+
+# سشن‌ها تنبل ساخته می‌شوند (torch/ultralytics فقط برای export لازم‌اند)؛
+# گراف بهینه‌شده در MODEL_CACHE_DIR می‌ماند تا بعد از ریبوت دوباره بهینه‌سازی نشود.
+# روی CPU هسته‌ها بین دو مدل تقسیم می‌شوند تا واقعاً موازی اجرا شوند
 providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
-y_sess = ort.InferenceSession("yolo11n.onnx", providers=providers)
-m_sess = ort.InferenceSession("midas_small.onnx", providers=providers)
+INTRA_OP_THREADS = threads_per_model(2)
+INTER_OP_THREADS = 1
+MODEL_CACHE_DIR = "model_cache"
+WARMUP_RUNS = 2
+
+def build_models(precision=None, mode=None):
+    precision, mode = precision or PRECISION, mode or INT8_MODE
+    if precision not in ("fp32", "int8"):
+        raise ValueError(f"unknown precision: {precision}")
+    manager = ModelManager(MODEL_CACHE_DIR, providers, INTRA_OP_THREADS, INTER_OP_THREADS, WARMUP_RUNS)
+    for name, path in MODEL_FILES.items():
+        if precision == "int8":
+            manager.register(name, quantized_path(path, mode), export=int8_export(name, mode))
+        else:
+            manager.register(name, path, export=EXPORTERS[name])
+    return manager
+
+models = build_models()
+
+# هر سشن نخ اختصاصی خودش را دارد؛ run در onnxruntime قفل GIL را آزاد می‌کند
+scheduler = InferenceScheduler(["yolo", "midas"])
 
-# راه حل نهایی برای خطا: پیدا کردن نام ورودی واقعی مدل در حافظه
-m_input_name = m_sess.get_inputs()[0].name 
-print(f"✅ MiDaS Input Name Detected: {m_input_name}")
+# --- تازه‌سازی تطبیقی (هر مدل نرخ مستقل خودش را دارد) ---
+# max_age: حداقل نرخ تازه‌سازی (ثانیه)؛ motion_threshold: میانگین اختلاف روشنایی تصویر کوچک (0..255)
+YOLO_REFRESH = dict(max_age=0.2, motion_threshold=4.0)
+MIDAS_REFRESH = dict(max_age=0.4, motion_threshold=4.0)
+yolo_gate = RefreshGate(**YOLO_REFRESH)
+midas_gate = RefreshGate(**MIDAS_REFRESH)
+motion_thumb = np.zeros((48, 64), dtype=np.uint8)
 
-async def process_yolo_onnx(img):
-    blob = cv2.resize(img, (640, 640)).transpose(2, 0, 1)[np.newaxis, ...].astype(np.float32) / 255.0
+def prepare_models(runs=None):
+    # قبل از حلقه‌ی کنترل صدا زده شود تا اولین تصمیم هزینه‌ی بارگذاری/بهینه‌سازی را ندهد
+    t0 = time.perf_counter()
+    report = models.warmup(runs=runs)
+    for name, r in report.items():
+        print(f"✅ {name}: {r}")
+    print(f"✅ Models ready in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return report
+
+def process_yolo_onnx(img, manager=None):
+    manager = manager or models
+    blob = yolo_input.fill(img)
     # YOLO معمولاً نام ورودی‌اش 'images' است
-    preds = y_sess.run(None, {y_sess.get_inputs()[0].name: blob})[0]
+    with latency.measure("yolo"):
+        preds = manager.session("yolo").run(None, {manager.input_name("yolo"): blob})[0]
     return preds[0].T 
 
-async def process_midas_onnx(img):
-    blob = cv2.resize(img, (256, 256)).transpose(2, 0, 1)[np.newaxis, ...].astype(np.float32) / 255.0
+def process_midas_onnx(img, manager=None):
+    manager = manager or models
+    blob = midas_input.fill(img)
     # استفاده از نام شناسایی شده (چه x باشد چه input چه هر چیز دیگر)
-    depth = m_sess.run(None, {m_input_name: blob})[0][0]
+    with latency.measure("midas"):
+        depth = manager.session("midas").run(None, {manager.input_name("midas"): blob})[0][0]
     
     # استخراج خط هزینه (منطق رادار) برای سرعت
     scan_zone = depth[128:230, :] 
@@ -56,38 +151,77 @@ async def process_midas_onnx(img):
     
     return cost_line, depth
 
-async def process_frame(frame):
-    img = cv2.resize(frame, (std_w, std_h))
-    
-    # اجرای موازی
-    yolo_task = process_yolo_onnx(img)
-    midas_task = process_midas_onnx(img)
-    yolo_results, (cost_line, depth_small) = await asyncio.gather(yolo_task, midas_task)
+def detect_obstacles(yolo_results):
+    # موانع نزدیک به صورت (x1, x2)؛ ورودی مدل 640x640 است و جعبه‌ها به مختصات std_w x std_h برمی‌گردند
+    boxes, _, _ = decode_yolo(yolo_results, YOLO_CONF, YOLO_IOU, YOLO_CLASSES,
+                              ratio=yolo_input.ratio, pad=yolo_input.pad)
+    near = boxes[:, 3] > std_h * 0.4
+    return boxes[near, 0], boxes[near, 2]
 
+def penalize_obstacles(obstacles, cost_line):
     # جریمه YOLO
-    for res in yolo_results:
-        if res[4] > 0.4:
-            x, y, w, h = res[:4]
-            x1, x2 = int(x - w/2), int(x + w/2)
-            y2 = int(y + h/2)
-            if y2 > std_h * 0.4: 
-                cost_line[max(0, x1):min(std_w, x2)] += 0.5
-
-    # پنجره لغزان
-    robot_width = std_w // 4 
-    best_cost, target_x = 100, std_w // 2
-    for x in range(0, std_w - robot_width, 15):
-        current_cost = np.mean(cost_line[x : x + robot_width])
-        bias = abs((x + robot_width//2) - std_w//2) / std_w
-        total = current_cost + (bias * 0.2)
-        if total < best_cost:
-            best_cost, target_x = total, x + robot_width // 2
+    apply_box_penalties(cost_line, obstacles[0], obstacles[1], 0.5)
+    return cost_line
+
+def decide_path(cost_line, robot_width, stride=None):
+    # window_curve = (مرکز پنجره‌ها، هزینه‌ی هر پنجره) برای هموارسازی و دیباگ
+    best_cost, target_x, window_curve = best_window(cost_line, robot_width,
+                                                    stride or WINDOW_STRIDE, center_bias=0.2)
 
     # تصمیم
     if best_cost > 0.8: decision = "backward"
     elif target_x < std_w * 0.38: decision = "left"
     elif target_x > std_w * 0.62: decision = "right"
     else: decision = "forward"
+    return decision, target_x, best_cost, window_curve
+
+async def process_frame(frame):
+    img = cv2.resize(frame, (std_w, std_h), dst=base_img)
+    now = time.monotonic()
+    thumb = motion_thumbnail(img, motion_thumb)
+    
+    # هر مدل فقط وقتی اجرا می‌شود که صحنه تغییر کرده یا نتیجه‌اش کهنه شده باشد؛
+    # اجراهای لازم موازی‌اند (هر مدل روی نخ خودش؛ تأخیر ≈ max(yolo, midas) نه مجموعشان)
+    run_yolo, run_midas = yolo_gate.due(thumb, now), midas_gate.due(thumb, now)
+    tasks = []
+    if run_yolo:
+        tasks.append(scheduler.run("yolo", process_yolo_onnx, img))
+    if run_midas:
+        tasks.append(scheduler.run("midas", process_midas_onnx, img))
+    results = list(await asyncio.gather(*tasks))
+    if run_yolo:
+        yolo_gate.store(detect_obstacles(results.pop(0)), thumb, now)
+    if run_midas:
+        midas_gate.store(results.pop(0), thumb, now)
+
+    obstacles = yolo_gate.value
+    depth_line, depth_small = midas_gate.value
+    with latency.measure("decide"):
+        # خط عمق ذخیره‌شده دست نمی‌خورد؛ جریمه‌ها روی کپی اعمال می‌شوند
+        cost_line = penalize_obstacles(obstacles, depth_line.copy())
+
+        # پنجره لغزان
+        robot_width = std_w // 4 
+        decision, target_x, best_cost, window_curve = decide_path(cost_line, robot_width)
+
+    # رندر فقط اگر رندرکننده فعال باشد و نوبتش رسیده باشد (img بافر مشترک است؛ کپی برای نخ رندر)
+    if renderer is not None and renderer.due():
+        renderer.submit((img.copy(), depth_small, decision, target_x, robot_width))
+
+    return decision
+
+def evaluate_frame(frame, manager=None):
+    # نسخه‌ی پشت‌سرهم process_frame برای مقایسه‌ی دقت‌ها؛ خروجی: (تصمیم، خط هزینه‌ی عمق قبل از جریمه‌ی YOLO)
+    img = cv2.resize(frame, (std_w, std_h), dst=base_img)
+    yolo_results = process_yolo_onnx(img, manager)
+    cost_line, _ = process_midas_onnx(img, manager)
+    depth_line = cost_line.copy()
+    penalize_obstacles(detect_obstacles(yolo_results), cost_line)
+    decision, _, _, _ = decide_path(cost_line, std_w // 4)
+    return decision, depth_line
+
+def draw_overlay(state):
+    img, depth_small, decision, target_x, robot_width = state
 
     # بصری‌سازی (مطابق استایل شما)
     depth_full = cv2.resize(depth_small, (std_w, std_h))
@@ -106,4 +240,38 @@ async def process_frame(frame):
     cv2.putText(display_img, f"COMMAND: {decision.upper()}", (20, 40), cv2.FONT_HERSHEY_DUPLEX, 0.8, color, 2)
     cv2.arrowedLine(display_img, (std_w // 2, std_h - 30), (target_x, std_h - 30), (255, 255, 255), 3)
 
-    return display_img, decision
+    return display_img
+
+def start_renderer(fps=None, sink=None):
+    # رندر اختیاری: روی ربات بدون نمایشگر صدا زده نمی‌شود و هیچ هزینه‌ای در حلقه‌ی کنترل ندارد
+    global renderer
+    if renderer is None:
+        renderer = FrameRenderer(draw_overlay, fps or RENDER_FPS, sink)
+        renderer.start()
+    return renderer
+
+def stop_renderer():
+    global renderer
+    if renderer is not None:
+        renderer.stop()
+        renderer.join(timeout=1.0)
+        renderer = None
+
+def compare_precision(source=None, mode=None, limit=None):
+    # INT8 در برابر fp32 روی فریم‌های ضبط‌شده: تأخیر، تطابق تصمیم‌ها و فاصله‌ی خط هزینه
+    frames = load_frames(source or CALIBRATION_SOURCE, limit or CALIBRATION_FRAMES)
+    if not frames:
+        raise FileNotFoundError(f"no frames to compare in {source or CALIBRATION_SOURCE}")
+    reference, candidate = build_models("fp32"), build_models("int8", mode)
+    reference.warmup()
+    candidate.warmup()
+    report = compare(lambda f: evaluate_frame(f, reference), lambda f: evaluate_frame(f, candidate), frames)
+    report["models"] = {"fp32": reference.report, "int8": candidate.report}
+    return report
+
+if __name__ == "__main__":
+    # python sampleWithModel.py compare [frames_dir|video] [static|dynamic]
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        source = sys.argv[2] if len(sys.argv) > 2 else None
+        mode = sys.argv[3] if len(sys.argv) > 3 else None
+        print(json.dumps(compare_precision(source, mode), indent=2))
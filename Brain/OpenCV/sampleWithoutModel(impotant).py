@@ -3,9 +3,16 @@ import numpy as np
 import asyncio
 import os
 import time
-from datetime import datetime
-from collections import deque
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.module1_stream.preprocessor import FrameHistory
+from modules.module1_stream.stream_handler import StreamReader, decode_jpeg
+from modules.module2_vision.path_analyzer import MaskBank, PathCostEngine, trapezoid_mask
+from modules.module2_vision.vision_processor import FARNEBACK_DEFAULTS, LK_DEFAULTS, BufferPool, FlowEstimator, canny
+from modules.module3_decision.command_generator import CommandEmitter
+from modules.module3_decision.decision_engine import TemporalCostFilter
+from utils.logger import BatchFileLogger
+from utils.metrics import StageLatency
 
 
 class UltimateLeaderBrain:
@@ -21,177 +28,257 @@ class UltimateLeaderBrain:
         self.SHADOW_TH = 35
         self.WALL_LIMIT = 0.92
 
+        # فرمان‌ها: حداکثر نرخ ارسال و ادغام فرمان‌های تکراری (فرمان‌های ایمنی مستثنا هستند)
+        self.emitter = CommandEmitter(max_rate=10.0, value_tolerance=0.05, repeat_interval=1.0)
+
+        # Optical Flow: "full" کل فریم، "roi" فقط مستطیل ماسک‌ها، "lk" شبکه‌ی نقاط Lucas-Kanade
+        self.FLOW_MODE = "full"
+        self.FLOW_SCALE = 1.0  # مثلا 0.5 = محاسبه در نصف رزولوشن (برای full و roi)
+        self.FARNEBACK_PARAMS = dict(FARNEBACK_DEFAULTS)
+        self.LK_PARAMS = dict(LK_DEFAULTS)
+
         # حافظه و کش
-        self.frame_cache = deque(maxlen=30)
-        self.path_memory = {a: deque(maxlen=15) for a in self.ANGLES}
+        self.frame_cache = FrameHistory(30, self.H, self.W)
+        # هموارسازی زمانی هزینه‌ی هر زاویه ("ema" یا "median" روی پنجره‌ی ۱۵ فریمی)
+        self.path_memory = TemporalCostFilter(len(self.ANGLES), mode="ema", alpha=0.35, window=15)
+        self.mask_bank = MaskBank(self.W, self.H, self.ANGLES)
+        self.cost_engine = PathCostEngine(self.mask_bank, self.SHADOW_TH)
+        self.buffers = BufferPool()
+        self.flow = FlowEstimator(self.buffers)
 
-        # صف‌های asyncio
+        # صف‌های asyncio (همه محدودند و فقط جدیدترین فریم/تصمیم را نگه می‌دارند)
+        self.jpeg_queue = asyncio.Queue(maxsize=1)
         self.frame_queue = asyncio.Queue(maxsize=1)
-        self.cmd_queue = asyncio.Queue()
-        self.log_queue = asyncio.Queue()
+        self.cmd_queue = asyncio.Queue(maxsize=1)
+        self.queue_drops = {"jpeg": 0, "frame": 0, "cmd": 0}
+
+        # لاگ دسته‌ای؛ max_bytes=0 یعنی بدون چرخش فایل
+        self.logger = BatchFileLogger(f"brain_{self.robot_id}_log.txt", max_bytes=0)
+        self.log_queue = self.logger.queue
+
+        # decode و OpenCV روی thread pool اجرا می‌شوند (OpenCV قفل GIL را آزاد می‌کند)
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"brain-{robot_id}")
+        self.reader = None
+        self.latency = StageLatency()
+        self.STATS_INTERVAL = 5.0
 
         self.is_running = True
         self.last_180_maneuver = 0
 
-        # VideoCapture برای ESP32
-        self.cap = cv2.VideoCapture(self.stream_url, cv2.CAP_FFMPEG)
-        # تلاش برای بهتر کار کردن با استریم ESP32
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        if not self.cap.isOpened():
-            print("WARNING: Cannot open ESP32 stream! چک کنید IP و استریم درست باشه.")
-
     # =====================
     # Logger Worker (لاگ در فایل)
     # =====================
     async def logger_worker(self):
-        log_file = f"brain_{self.robot_id}_log.txt"
+        await self.logger.run(lambda: self.is_running)
+
+    def log(self, msg):
+        self.logger.log(msg)
+
+    # =====================
+    # Decode Worker (دیکد JPEG روی thread pool)
+    # =====================
+    async def decode_worker(self):
+        loop = asyncio.get_running_loop()
         while self.is_running:
-            try:
-                msg = await self.log_queue.get()
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}\n")
-                self.log_queue.task_done()
-            except Exception as e:
-                print("Logger Error:", e)
+            t_recv, jpg = await self.jpeg_queue.get()
+            self.latency.record("queue", time.perf_counter() - t_recv)
+            frame = await loop.run_in_executor(self.executor, self.decode_frame, jpg)
+            if frame is not None:
+                self._put_latest(self.frame_queue, (t_recv, frame), "frame")
+
+    def decode_frame(self, jpg):
+        with self.latency.measure("decode"):
+            frame = decode_jpeg(jpg)
+            if frame is None:
+                return None
+            return cv2.resize(frame, (self.W, self.H))
 
     # =====================
     # Vision Worker (پردازش تصویر و محاسبه هزینه مسیرها)
     # =====================
     async def vision_worker(self):
+        loop = asyncio.get_running_loop()
         while self.is_running:
-            frame = await self.frame_queue.get()
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            self.frame_cache.append(gray)
-
-            if np.mean(gray) < 10:
-                await self.cmd_queue.put({"cmd": "stop", "cost": 1.0, "angle": 0, "is_narrow": False})
-                await self.log_queue.put("CRITICAL: NO LIGHT - محیط خیلی تاریک")
-                continue
+            t_recv, frame = await self.frame_queue.get()
+            data, logs = await loop.run_in_executor(self.executor, self.analyze_frame, frame)
+            for msg in logs:
+                self.log(msg)
+            if data is not None:
+                data["t_recv"] = t_recv
+                self._put_latest(self.cmd_queue, data, "cmd", keep=self.is_safety)
 
-            if len(self.frame_cache) < 2:
-                continue
-            reference_frame = self.frame_cache[0]
+    def analyze_frame(self, frame):
+        with self.latency.measure("vision"):
+            return self._analyze_frame(frame)
 
-            flow = cv2.calcOpticalFlowFarneback(reference_frame, gray, None,
-                                                0.5, 3, 15, 3, 5, 1.2, 0)
-            mag, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
-            edges = cv2.Canny(gray, 50, 150)
+    def _analyze_frame(self, frame):
+        # ماسک‌ها فقط وقتی W, H یا ANGLES عوض شوند دوباره ساخته می‌شوند
+        bank = self.mask_bank.ensure(self.W, self.H, self.ANGLES)
+        history = self.frame_cache.ensure(self.H, self.W)
 
-            costs = {}
-            for a in self.ANGLES:
-                mask, _ = self.get_trapezoid_mask(a)
-                m_idx = mask == 255
-                if np.sum(m_idx) == 0:
-                    costs[a] = 1.0
-                    continue
+        # فریم خاکستری مستقیم در بافر حلقه نوشته می‌شود و آمارش یک بار حساب می‌شود
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=history.slot())
+        history.push(self.cost_engine)
 
-                f_mean = np.mean(mag[m_idx])
-                e_density = np.sum(edges[m_idx] > 0) / np.sum(m_idx)
-                brightness_diff = np.mean(reference_frame[m_idx]) - np.mean(gray[m_idx])
+        if history.means[history.newest] < 10:
+            return ({"cmd": "stop", "cost": 1.0, "angle": 0, "is_narrow": False},
+                    ["CRITICAL: NO LIGHT - محیط خیلی تاریک"])
 
-                is_shadow = brightness_diff > self.SHADOW_TH and e_density < 0.04
-                is_passable = f_mean < 0.7 and e_density < 0.07
+        if len(history) < 2:
+            return None, []
+        reference_frame = history.frames[history.oldest]
 
-                cost = 0.15 if (is_shadow or is_passable) else min(1.0, (f_mean * 0.4) + (e_density * 3.5))
-                costs[a] = round(cost, 3)
+        mag, mean_mag = self.flow.compute(reference_frame, gray, bank, self.FLOW_MODE, self.FLOW_SCALE,
+                                          self.FARNEBACK_PARAMS, self.LK_PARAMS)
+        edges = canny(gray, self.buffers)
+        self.cost_engine.shadow_th = self.SHADOW_TH
+        cost_values = self.cost_engine.score(mag, edges, history.brightness_diff())
+        costs = dict(zip(bank.angles, cost_values.tolist()))
 
-            best_a = min(costs, key=costs.get)
-            is_stuck = np.mean(mag) < 0.08 and len(self.frame_cache) > 25
+        best_a = min(costs, key=costs.get)
+        is_stuck = mean_mag < 0.08 and len(history) > 25
 
-            await self.cmd_queue.put({
-                "angle": best_a,
-                "cost": costs[best_a],
-                "costs": costs,
-                "frame": frame,
-                "is_stuck": is_stuck,
-                "is_narrow": costs[self.ANGLES[0]] > 0.65 and costs[self.ANGLES[-1]] > 0.65
-            })
+        return {
+            "angle": best_a,
+            "cost": costs[best_a],
+            "costs": costs,
+            "frame": frame,
+            "is_stuck": is_stuck,
+            "is_narrow": costs[self.ANGLES[0]] > 0.65 and costs[self.ANGLES[-1]] > 0.65
+        }, []
 
     # =====================
     # Command Worker (تصمیم‌گیری و چاپ دستورات در کنسول)
     # =====================
     async def command_worker(self):
         while self.is_running:
-            data = await self.cmd_queue.get()
-            angle, cost = data['angle'], data['cost']
-
-            # تصمیم‌گیری حرکت
-            if cost > self.WALL_LIMIT:
-                if time.time() - self.last_180_maneuver > 7:
-                    cmd = "turn_right_180"
-                    val = 1.0
-                    self.last_180_maneuver = time.time()
-                    await self.log_queue.put("WALL DETECTED: اجرای مانور 180 درجه")
-                else:
-                    cmd = "backward"
-                    val = 0.4
-            elif data.get("is_stuck"):
-                cmd = "turn_left_escape"
-                val = 0.75
-                await self.log_queue.put("STUCK: تلاش برای فرار")
-            elif data.get("is_narrow"):
-                cmd = "slow_forward"
-                val = 0.3
-                await self.log_queue.put("NARROW PATH: حرکت آهسته")
-            elif angle < 0:
-                cmd = "turn_left"
-                val = round(1.0 - cost, 2)
-            elif angle > 0:
-                cmd = "turn_right"
-                val = round(1.0 - cost, 2)
+            try:
+                data = await asyncio.wait_for(self.cmd_queue.get(), self.emitter.time_until_due())
+            except asyncio.TimeoutError:
+                # مهلت محدودیت نرخ تمام شده؛ آخرین تصمیم منتظر فرستاده می‌شود
+                self.send_command(self.emitter.poll())
+                continue
+
+            command = self.decide(data)
+            self.send_command(self.emitter.offer(command))
+            if "t_recv" in data:
+                self.latency.record("total", time.perf_counter() - data["t_recv"])
+
+    def decide(self, data):
+        angle, cost, is_narrow = self.smooth_costs(data)
+
+        # تصمیم‌گیری حرکت (دیوار روی هزینه‌ی خام همین فریم بررسی می‌شود تا فیلتر تأخیر نیندازد)
+        if data.get("cmd") == "stop":
+            cmd = "stop"
+            val = 0.0
+        elif data['cost'] > self.WALL_LIMIT:
+            if time.time() - self.last_180_maneuver > 7:
+                cmd = "turn_right_180"
+                val = 1.0
+                self.last_180_maneuver = time.time()
+                self.log("WALL DETECTED: اجرای مانور 180 درجه")
             else:
-                cmd = "forward"
-                val = round(1.0 - cost, 2)
+                cmd = "backward"
+                val = 0.4
+        elif data.get("is_stuck"):
+            cmd = "turn_left_escape"
+            val = 0.75
+            self.log("STUCK: تلاش برای فرار")
+        elif is_narrow:
+            cmd = "slow_forward"
+            val = 0.3
+            self.log("NARROW PATH: حرکت آهسته")
+        elif angle < 0:
+            cmd = "turn_left"
+            val = round(1.0 - cost, 2)
+        elif angle > 0:
+            cmd = "turn_right"
+            val = round(1.0 - cost, 2)
+        else:
+            cmd = "forward"
+            val = round(1.0 - cost, 2)
+        return {"cmd": cmd, "val": val, "angle": angle, "cost": cost}
+
+    def send_command(self, command):
+        if command is None:
+            return
+        cmd, val, angle, cost = command["cmd"], command["val"], command["angle"], command["cost"]
+        # چاپ دستور در کنسول (اینجا می‌تونید به ربات بفرستید)
+        print(f"🤖 [{self.robot_id}] CMD: {cmd.upper():<18} | VALUE: {val} | ANGLE: {angle:>+4}° | COST: {cost:.2f}")
 
-            # چاپ دستور در کنسول (اینجا می‌تونید به ربات بفرستید)
-            print(f"🤖 [{self.robot_id}] CMD: {cmd.upper():<18} | VALUE: {val} | ANGLE: {angle:>+4}° | COST: {cost:.2f}")
+        self.log(f"CMD: {cmd} | VAL: {val} | A:{angle} | C:{cost}")
 
-            await self.log_queue.put(f"CMD: {cmd} | VAL: {val} | A:{angle} | C:{cost}")
+    def command_stats(self):
+        return {"cmd_queue_depth": self.cmd_queue.qsize(),
+                "queue_drops": dict(self.queue_drops),
+                **self.emitter.stats}
+
+    def smooth_costs(self, data):
+        # جهت حرکت روی هزینه‌های هموارشده انتخاب می‌شود تا فرمان چرخش مدام عوض نشود
+        if "costs" not in data:
+            return data['angle'], data['cost'], data.get("is_narrow", False)
+        angles = list(data["costs"])
+        smoothed = self.path_memory.update(list(data["costs"].values()))
+        i = int(np.argmin(smoothed))
+        is_narrow = bool(smoothed[0] > 0.65 and smoothed[-1] > 0.65)
+        return angles[i], round(float(smoothed[i]), 3), is_narrow
 
     # =====================
-    # Receiver Task (خواندن فریم‌ها از استریم)
+    # Receiver Task (خواندن فریم‌ها از استریم در نخ جداگانه)
     # =====================
-    
     async def receiver_task(self):
         print("تلاش برای اتصال به استریم...")
+        loop = asyncio.get_running_loop()
+
+        def on_jpeg(t_recv, jpg):
+            # در نخ خواننده صدا زده می‌شود
+            loop.call_soon_threadsafe(self._put_latest, self.jpeg_queue, (t_recv, jpg), "jpeg")
+
+        self.reader = StreamReader(self.stream_url, on_jpeg)
+        self.reader.start()
+        # بدون join در executor: با Ctrl-C (لغو task) نخ خواننده هم متوقف می‌شود و asyncio.run منتظر نمی‌ماند
         try:
-            with requests.get(self.stream_url, stream=True, timeout=20) as r:
-                r.raise_for_status()
-                bytes_data = b''
-                for chunk in r.iter_content(chunk_size=1024):
-                    if not self.is_running:
-                        break
-                    bytes_data += chunk
-                    a = bytes_data.find(b'\xff\xd8')
-                    b = bytes_data.find(b'\xff\xd9')
-                    if a != -1 and b != -1:
-                        jpg = bytes_data[a:b+2]
-                        bytes_data = bytes_data[b+2:]
-                        frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                        if frame is not None:
-                            frame_resized = cv2.resize(frame, (self.W, self.H))
-                            if self.frame_queue.full():
-                                try:
-                                    self.frame_queue.get_nowait()
-                                except:
-                                    pass
-                            await self.frame_queue.put(frame_resized)
-        except Exception as e:
-            print(f"خطا: {e} — احتمالاً مرورگر بازه یا کلاینت دیگه‌ای وصله")
+            while self.reader.is_alive():
+                await asyncio.sleep(0.1)
+        finally:
+            self.reader.stop()
+        if self.reader.error is not None:
+            print(f"خطا: {self.reader.error} — احتمالاً مرورگر بازه یا کلاینت دیگه‌ای وصله")
+
+    def _put_latest(self, queue, item, name, keep=None):
+        # آیتم قدیمی دور ریخته می‌شود تا همیشه جدیدترین فریم/تصمیم پردازش شود
+        # مگر keep(آیتم قدیمی) درست باشد (مثلاً stop ایمنی)؛ آن وقت آیتم جدید دور ریخته می‌شود
+        if queue.full():
+            try:
+                old = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                old = None
+            else:
+                self.queue_drops[name] += 1
+                if keep is not None and keep(old):
+                    queue.put_nowait(old)
+                    return
+        queue.put_nowait(item)
+
+    def is_safety(self, data):
+        # تصمیم‌های ایمنی (فریم تاریک یا دیوار روی هزینه‌ی خام) نباید با فریم بعدی جایگزین شوند
+        return data.get("cmd") == "stop" or data["cost"] > self.WALL_LIMIT
+
+    # =====================
+    # Stats Worker (گزارش تأخیر مراحل و آمار فرمان‌ها)
+    # =====================
+    async def stats_worker(self):
+        while self.is_running:
+            await asyncio.sleep(self.STATS_INTERVAL)
+            if self.latency.samples:
+                self.log(f"LATENCY: {self.latency.format()}")
+            self.log(f"COMMANDS: {self.command_stats()}")
+
     # =====================
     # ماسک مسیر (تراپزوئید)
     # =====================
     def get_trapezoid_mask(self, angle):
-        mask = np.zeros((self.H, self.W), dtype=np.uint8)
-        offset = int((angle / 30.0) * self.W * 0.28)
-        pts = np.array([
-            [self.W//2 - 20 + offset, 90],
-            [self.W//2 + 20 + offset, 90],
-            [self.W//2 + 70 + offset, 240],
-            [self.W//2 - 70 + offset, 240]
-        ], dtype=np.int32)
-        cv2.fillPoly(mask, [pts], 255)
-        return mask, pts
+        return trapezoid_mask(angle, self.W, self.H)
 
     # =====================
     # اجرا
@@ -201,14 +288,19 @@ class UltimateLeaderBrain:
         print("دستورات حرکت در کنسول نمایش داده می‌شوند.")
         await asyncio.gather(
             self.receiver_task(),
+            self.decode_worker(),
             self.vision_worker(),
             self.command_worker(),
-            self.logger_worker()
+            self.logger_worker(),
+            self.stats_worker()
         )
 
     def stop(self):
         self.is_running = False
-        self.cap.release()
+        if self.reader is not None:
+            self.reader.stop()
+        self.executor.shutdown(wait=False)
+        self.logger.close()
         print("Brain stopped.")
 
 
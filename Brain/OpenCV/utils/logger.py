@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+
+
+# =====================
+# لاگر فایل با نوشتن دسته‌ای (فایل باز می‌ماند و با بافر نوشته می‌شود)
+# =====================
+class BatchFileLogger:
+    def __init__(self, path, maxsize=1000, batch_size=256, flush_bytes=8192,
+                 flush_interval=1.0, max_bytes=0, backup_count=3):
+        self.path = path
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes          # 0 یعنی بدون چرخش فایل
+        self.backup_count = backup_count
+
+        self.file = None
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = time.monotonic()
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.written = 0
+        self._stamp_sec = None
+        self._stamp = ""
+
+    # تولیدکننده‌ها هیچ‌وقت منتظر نمی‌مانند؛ اگر صف پر باشد پیام شمرده و دور ریخته می‌شود
+    def log(self, msg):
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _timestamp(self):
+        # strftime فقط یک بار در هر ثانیه
+        sec = int(time.time())
+        if sec != self._stamp_sec:
+            self._stamp_sec = sec
+            self._stamp = time.strftime('%H:%M:%S', time.localtime(sec))
+        return self._stamp
+
+    def _append(self, msg):
+        line = f"[{self._timestamp()}] {msg}\n"
+        self.pending.append(line)
+        self.pending_bytes += len(line)
+
+    async def run(self, is_running):
+        while is_running():
+            try:
+                msg = await asyncio.wait_for(self.queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                self.flush()
+                continue
+            self._append(msg)
+            self._drain(self.batch_size - 1)
+            if (self.pending_bytes >= self.flush_bytes
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self.flush()
+
+    def _drain(self, limit=None):
+        count = 0
+        while limit is None or count < limit:
+            try:
+                self._append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+            count += 1
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.dropped > self.reported_dropped:
+            self._append(f"LOGGER: {self.dropped - self.reported_dropped} messages dropped (queue full)")
+            self.reported_dropped = self.dropped
+        if not self.pending:
+            return
+        try:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.write("".join(self.pending))
+            self.file.flush()
+            self.written += len(self.pending)
+            if self.max_bytes and self.file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            print("Logger Error:", e)
+        self.pending.clear()
+        self.pending_bytes = 0
+
+    def _rotate(self):
+        # brain.log -> brain.log.1 -> brain.log.2 ...
+        self.file.close()
+        self.file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        self._drain()
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
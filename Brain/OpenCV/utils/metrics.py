@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# =====================
+# اندازه‌گیری تأخیر هر مرحله (پنجره‌ی لغزان از آخرین نمونه‌ها)
+# =====================
+class StageLatency:
+    def __init__(self, window=256):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        # record از نخ‌های worker و summary از نخ اصلی صدا زده می‌شوند
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+
+    @contextmanager
+    def measure(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def summary(self):
+        # خروجی بر حسب میلی‌ثانیه
+        # کپی زیر قفل؛ محاسبه‌ی percentile بیرون از قفل تا record منتظر نماند
+        with self._lock:
+            snapshot = [(stage, list(samples), self.counts[stage]) for stage, samples in self.samples.items()]
+        out = {}
+        for stage, samples, count in snapshot:
+            values = np.array(samples) * 1000.0
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            out[stage] = {
+                "count": count,
+                "p50": round(float(p50), 2),
+                "p95": round(float(p95), 2),
+                "p99": round(float(p99), 2),
+                "max": round(float(values.max()), 2),
+            }
+        return out
+
+    def format(self):
+        return " | ".join(f"{stage}: p50={s['p50']}ms p95={s['p95']}ms max={s['max']}ms"
+                          for stage, s in self.summary().items())
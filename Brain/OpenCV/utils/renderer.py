@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+# =====================
+# رندر اختیاری روی نخ جداگانه با نرخ پایین‌تر از حلقه‌ی کنترل (فقط آخرین وضعیت رسم می‌شود)
+# =====================
+class FrameRenderer(threading.Thread):
+    def __init__(self, draw, fps=5.0, sink=None):
+        # draw(state) -> تصویر ؛ sink(image) مثلاً نمایش یا ارسال (None = فقط نگه‌داری در last_image)
+        super().__init__(daemon=True, name="renderer")
+        self.draw = draw
+        self.sink = sink
+        self.fps = fps
+        self.state = None
+        self.last_image = None
+        self.last_submit = float("-inf")
+        self.error = None
+        self.stats = {"submitted": 0, "rendered": 0, "replaced": 0}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps if self.fps else 0.0
+
+    def due(self, now=None):
+        # حلقه‌ی کنترل فقط وقتی وضعیت (و کپی تصویر) می‌سازد که نوبت رندر رسیده باشد
+        now = time.monotonic() if now is None else now
+        return now - self.last_submit >= self.interval
+
+    def submit(self, state, now=None):
+        # هیچ‌وقت منتظر نمی‌ماند؛ وضعیت رسم‌نشده‌ی قبلی جایگزین می‌شود
+        with self._lock:
+            if self.state is not None:
+                self.stats["replaced"] += 1
+            self.state = state
+        self.stats["submitted"] += 1
+        self.last_submit = time.monotonic() if now is None else now
+        self._ready.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                if not self._ready.wait(timeout=0.5):
+                    continue
+                with self._lock:
+                    state, self.state = self.state, None
+                    self._ready.clear()
+                if state is None:
+                    continue
+                image = self.draw(state)
+                self.last_image = image
+                self.stats["rendered"] += 1
+                if self.sink is not None:
+                    self.sink(image)
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        self._stop_event.set()
+        self._ready.set()
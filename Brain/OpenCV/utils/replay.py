@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import redirect_stdout
+
+import cv2
+import numpy as np
+
+from modules.module1_stream.stream_handler import MjpegParser, decode_jpeg
+from utils.metrics import StageLatency
+
+MJPEG_EXTS = (".mjpg", ".mjpeg")
+BRAIN_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "sampleWithoutModel(impotant).py")
+
+
+# =====================
+# منابع فریم: فایل MJPEG ضبط‌شده، فایل ویدیو یا صحنه‌ی مصنوعی — همه به صورت بایت JPEG
+# (تا دیکد هم مثل استریم زنده جزء اندازه‌گیری باشد)
+# =====================
+def read_mjpeg(path, limit=None, chunk_size=64 * 1024):
+    parser = MjpegParser()
+    jpegs = []
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            parser.feed(chunk)
+            for jpg in parser.frames():
+                jpegs.append(bytes(jpg))
+                if limit and len(jpegs) >= limit:
+                    return jpegs
+    return jpegs
+
+
+def read_video(path, limit=None, quality=90):
+    cap = cv2.VideoCapture(path)
+    jpegs = []
+    while not limit or len(jpegs) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        jpegs.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    fps = cap.get(cv2.CAP_PROP_FPS) or None
+    cap.release()
+    return jpegs, fps
+
+
+def synthetic_frames(n_frames=300, W=640, H=480, seed=0):
+    # زمین بافت‌دار + مانع تیره‌ی متحرک + لرزش دوربین (برای optical flow) + چند فریم تاریک و دیوار
+    rng = np.random.default_rng(seed)
+    floor = np.clip(np.linspace(60, 200, H)[:, None, None] + rng.normal(0, 25, (H, W, 3)), 0, 255).astype(np.uint8)
+    frames = []
+    for i in range(n_frames):
+        img = np.roll(floor, (i * 3) % W, axis=1)
+        x = int((i * 7) % (W + 160)) - 80
+        cv2.rectangle(img, (x, H // 2), (x + 120, H - 20), (20, 20, 25), -1)
+        if (i // 60) % 5 == 3:
+            img[:] = img // 2 + 100   # دیوار/صحنه‌ی یکنواخت نزدیک
+        if (i // 60) % 5 == 4 and i % 60 < 5:
+            img[:] = 3                # چند فریم بدون نور
+        frames.append(img)
+    return frames
+
+
+def load_source(spec, limit=None):
+    # خروجی: (لیست JPEG، fps اسمی منبع یا None)
+    if spec.startswith("synthetic"):
+        n = int(spec.split(":", 1)[1]) if ":" in spec else 300
+        n = min(n, limit) if limit else n
+        return [cv2.imencode(".jpg", f)[1].tobytes() for f in synthetic_frames(n)], None
+    if spec.lower().endswith(MJPEG_EXTS):
+        return read_mjpeg(spec, limit), None
+    return read_video(spec, limit)
+
+
+# =====================
+# آداپتور دو مغز: step(jpg) -> تصمیم (رشته‌ی فرمان یا None)، latency = StageLatency
+# =====================
+class ClassicalPipeline:
+    name = "classical"
+
+    def __init__(self, window=100000, log_path=os.devnull, **settings):
+        spec = importlib.util.spec_from_file_location("leader_brain", BRAIN_FILE)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.brain = module.UltimateLeaderBrain("replay")
+        self.brain.logger.path = log_path   # لاگ مغز در بازپخش پیش‌فرض دور ریخته می‌شود
+        for key, value in settings.items():
+            setattr(self.brain, key, value)   # مثلا FLOW_MODE="roi"
+        self.latency = self.brain.latency = StageLatency(window)
+
+    async def prepare(self):
+        pass
+
+    async def step(self, jpg):
+        frame = self.brain.decode_frame(jpg)
+        if frame is None:
+            return None
+        data, _ = self.brain.analyze_frame(frame)
+        if data is None:
+            return None
+        with self.latency.measure("decide"):
+            return self.brain.decide(data)["cmd"]
+
+    def extra(self):
+        return {"flow_mode": self.brain.FLOW_MODE, "flow_scale": self.brain.FLOW_SCALE}
+
+    def close(self):
+        self.brain.executor.shutdown(wait=False)
+        self.brain.logger.close()
+
+
+class ModelPipeline:
+    name = "model"
+
+    def __init__(self, window=100000, model_dir=None):
+        if model_dir:
+            os.chdir(model_dir)   # مسیر مدل‌ها در sampleWithModel نسبی است
+        import sampleWithModel
+        self.module = sampleWithModel
+        self.latency = sampleWithModel.latency = StageLatency(window)
+
+    async def prepare(self):
+        self.module.prepare_models()
+        for gate in (self.module.yolo_gate, self.module.midas_gate):
+            gate.reset()
+
+    async def step(self, jpg):
+        with self.latency.measure("decode"):
+            frame = decode_jpeg(jpg)
+        if frame is None:
+            return None
+        return await self.module.process_frame(frame)
+
+    def extra(self):
+        return {"precision": self.module.PRECISION,
+                "refresh": {"yolo": dict(self.module.yolo_gate.stats),
+                            "midas": dict(self.module.midas_gate.stats)}}
+
+    def close(self):
+        self.module.scheduler.shutdown(wait=False)
+
+
+PIPELINES = {"classical": ClassicalPipeline, "model": ModelPipeline}
+
+
+# =====================
+# اجرای بازپخش: حداکثر سرعت یا با زمان واقعی (دوربین جلو می‌رود؛ فقط جدیدترین فریم پردازش می‌شود)
+# =====================
+async def replay(pipeline, jpegs, fps=None, alloc_frames=0):
+    await pipeline.prepare()
+    decisions, dropped = [], 0
+    t_start = time.perf_counter()
+    if fps:
+        last = -1
+        while True:
+            idx = int((time.perf_counter() - t_start) * fps)
+            if idx >= len(jpegs):
+                break
+            if idx == last:
+                await asyncio.sleep((idx + 1) / fps - (time.perf_counter() - t_start))
+                continue
+            dropped += idx - last - 1
+            last = idx
+            with pipeline.latency.measure("frame"):
+                decisions.append(await pipeline.step(jpegs[idx]))
+    else:
+        for jpg in jpegs:
+            with pipeline.latency.measure("frame"):
+                decisions.append(await pipeline.step(jpg))
+    seconds = time.perf_counter() - t_start
+
+    result = {
+        "pipeline": pipeline.name,
+        "mode": f"realtime@{fps}" if fps else "max_speed",
+        "frames_in": len(jpegs),
+        "processed": len(decisions),
+        "dropped": dropped,
+        "seconds": round(seconds, 3),
+        "fps": round(len(decisions) / seconds, 2) if seconds else 0.0,
+        "stages": pipeline.latency.summary(),
+        "decision_counts": dict(Counter(d for d in decisions if d is not None)),
+        "decisions": decisions,
+    }
+    if alloc_frames:
+        result["alloc_kb_per_frame"] = await measure_allocations(pipeline, jpegs[:alloc_frames])
+    result.update(pipeline.extra())
+    return result
+
+
+async def measure_allocations(pipeline, jpegs):
+    # پاس جداگانه (tracemalloc خودش کند است و نباید روی زمان‌ها اثر بگذارد)
+    tracemalloc.start()
+    peaks = []
+    for jpg in jpegs:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await pipeline.step(jpg)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return round(float(np.mean(peaks)) / 1024, 1) if peaks else None
+
+
+def compare_results(baseline, current):
+    # تغییر FPS و p95 هر مرحله نسبت به اجرای مرجع (برای پیدا کردن پسرفت کارایی)
+    out = {}
+    for name, cur in current["runs"].items():
+        base = baseline.get("runs", {}).get(name)
+        if base is None:
+            continue
+        stages = {}
+        for stage, s in cur["stages"].items():
+            if stage in base["stages"]:
+                stages[stage] = round(s["p95"] - base["stages"][stage]["p95"], 2)
+        same = sum(a == b for a, b in zip(base["decisions"], cur["decisions"]))
+        out[name] = {"fps_ratio": round(cur["fps"] / base["fps"], 3) if base["fps"] else None,
+                     "p95_delta_ms": stages,
+                     "decision_agreement": round(same / max(1, min(len(base["decisions"]), len(cur["decisions"]))), 3)}
+    return out
+
+
+# =====================
+# python -m utils.replay SOURCE [--pipeline both] [--realtime] [--fps 30] [--out result.json]
+# SOURCE: فایل .mjpg ضبط‌شده از ESP32، فایل ویدیو، یا synthetic[:N]
+# =====================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="offline replay benchmark for the vision pipelines")
+    parser.add_argument("source")
+    parser.add_argument("--pipeline", choices=["classical", "model", "both"], default="both")
+    parser.add_argument("--realtime", action="store_true", help="pace frames at the source fps")
+    parser.add_argument("--fps", type=float, default=None, help="fps for --realtime (default: source or 30)")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--alloc", type=int, default=0, metavar="N", help="measure allocations on N frames")
+    parser.add_argument("--flow-mode", default=None, help="classical FLOW_MODE override")
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--baseline", default=None, help="earlier result JSON to compare against")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    out_path = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    jpegs, source_fps = load_source(args.source, args.limit)
+    if not jpegs:
+        parser.error(f"no frames in {args.source}")
+    fps = (args.fps or source_fps or 30.0) if args.realtime else None
+
+    report = {"source": args.source, "frames": len(jpegs), "cores": os.cpu_count(), "runs": {}}
+    names = ["classical", "model"] if args.pipeline == "both" else [args.pipeline]
+    # چاپ‌های پیشرفت/دیباگ مغزها (مثل prepare_models) به stderr؛ stdout فقط JSON نتیجه
+    with redirect_stdout(sys.stderr):
+        for name in names:
+            if name == "classical":
+                kwargs = {"FLOW_MODE": args.flow_mode} if args.flow_mode else {}
+            else:
+                kwargs = {"model_dir": args.model_dir}
+            pipeline = PIPELINES[name](**kwargs)
+            try:
+                report["runs"][name] = asyncio.run(replay(pipeline, jpegs, fps, args.alloc))
+            finally:
+                pipeline.close()
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            report["vs_baseline"] = compare_results(json.load(f), report)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,249 @@
+import json
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+from networking.mqtt.message_schema import COMMAND_SCHEMA, STATE_SCHEMA
+
+# ————————————————————————————————————————
+# لایه‌ی codec: JSON (پیش‌فرض و پشتیبان) و قالب باینری فشرده‌ی bin1 برای command و state
+# گیرنده قالب را از بایت اول تشخیص می‌دهد؛ فرستنده برای هر تاپیک/ربات codec را انتخاب می‌کند
+# ————————————————————————————————————————
+
+MAGIC = 0xB1            # بایت اول bin1 ؛ JSON همیشه با '{' یا فاصله شروع می‌شود
+KIND_COMMAND = 1
+KIND_STATE = 2
+CODECS_FIELD = "codecs"  # ربات در state/stream_state اعلام می‌کند کدام codecها را می‌فهمد
+
+# جدول‌های عددی enumها مستقیماً از schema (ترتیب لیست = کد) ؛ مقدار جدید فقط به ته لیست اضافه شود
+CMD_CODES = {v: i for i, v in enumerate(COMMAND_SCHEMA["cmd"])}
+MODE_CODES = {v: i for i, v in enumerate(STATE_SCHEMA["mode"])}
+STATUS_CODES = {v: i for i, v in enumerate(STATE_SCHEMA["status"])}
+
+# magic, kind, timeStamp(ms)، سپس فیلدهای ثابت؛ رشته‌ها با طول یک‌بایتی در انتها
+_COMMAND_HEAD = struct.Struct("<BBqBB")      # ..., cmd, len(value)
+_STATE_HEAD = struct.Struct("<BBqhfBB")      # ..., battery, speed, mode, status
+_LEN = struct.Struct("<B")
+
+
+class CodecError(ValueError):
+    # ValueError تا TopicRouter آن را مثل JSON نامعتبر گزارش کند
+    pass
+
+
+# ————————————————————————————————————————
+# زمان: رشته‌ی ISO <-> میلی‌ثانیه از epoch (UTC)
+# ————————————————————————————————————————
+
+
+def iso_to_ms(text):
+    dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def ms_to_iso(ms):
+    # isoformat خیلی سریع‌تر از strftime است؛ "+00:00" انتها با Z جایگزین می‌شود
+    dt = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    return dt.isoformat(timespec="milliseconds" if ms % 1000 else "seconds")[:-6] + "Z"
+
+
+# ————————————————————————————————————————
+# codecها: encode(kind, payload) -> bytes ؛ decode(raw) -> dict
+# ————————————————————————————————————————
+
+
+class JsonCodec:
+    name = "json"
+
+    # بدون فاصله‌ی اضافه (json.dumps پیش‌فرض بعد از , و : فاصله می‌گذارد)؛ encoder یک بار ساخته می‌شود
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def encode(self, kind, payload):
+        return self._encoder.encode(payload).encode()
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+class BinaryCodec:
+    # bin1: فقط پیام‌هایی که دقیقاً مطابق schema هستند؛ بقیه CodecError (فرستنده به JSON برمی‌گردد)
+    # value و speed به صورت float32 منتقل می‌شوند (همان دقت سمت ESP32)
+    name = "bin1"
+
+    def encode(self, kind, payload):
+        try:
+            if kind == "command" and len(payload) == len(COMMAND_SCHEMA):
+                return self._encode_command(payload)
+            if kind == "state" and len(payload) == len(STATE_SCHEMA):
+                return self._encode_state(payload)
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError, struct.error) as e:
+            raise CodecError(f"{kind} not representable in {self.name}: {e!r}") from None
+        raise CodecError(f"{kind} not representable in {self.name}")
+
+    @staticmethod
+    def _text(value):
+        data = value.encode()
+        return _LEN.pack(len(data)) + data
+
+    def _encode_command(self, p):
+        value = p["value"]
+        return b"".join((
+            _COMMAND_HEAD.pack(MAGIC, KIND_COMMAND, iso_to_ms(p["timeStamp"]),
+                               CMD_CODES[p["cmd"]], len(value)),
+            struct.pack(f"<{len(value)}f", *value),
+            self._text(p["robotId"]),
+        ))
+
+    def _encode_state(self, p):
+        if type(p["battery"]) is not int:
+            raise TypeError("battery must be int")
+        return b"".join((
+            _STATE_HEAD.pack(MAGIC, KIND_STATE, iso_to_ms(p["timeStamp"]), p["battery"],
+                             p["speed"], MODE_CODES[p["mode"]], STATUS_CODES[p["status"]]),
+            self._text(p["robotId"]),
+            self._text(p["currentLocation"]),
+        ))
+
+    def decode(self, raw):
+        try:
+            if raw[1] == KIND_COMMAND:
+                return self._decode_command(raw)
+            if raw[1] == KIND_STATE:
+                return self._decode_state(raw)
+        except (IndexError, UnicodeDecodeError, struct.error) as e:
+            raise CodecError(f"truncated or corrupt {self.name} payload: {e!r}") from None
+        raise CodecError(f"unknown {self.name} kind: {raw[1]}")
+
+    @staticmethod
+    def _read_text(raw, offset):
+        n = raw[offset]
+        end = offset + 1 + n
+        if end > len(raw):
+            raise IndexError("string past end of payload")
+        return bytes(raw[offset + 1:end]).decode(), end
+
+    def _decode_command(self, raw):
+        _, _, ms, cmd, n = _COMMAND_HEAD.unpack_from(raw)
+        offset = _COMMAND_HEAD.size
+        value = list(struct.unpack_from(f"<{n}f", raw, offset))
+        robot_id, _ = self._read_text(raw, offset + 4 * n)
+        return {"robotId": robot_id, "cmd": COMMAND_SCHEMA["cmd"][cmd],
+                "value": value, "timeStamp": ms_to_iso(ms)}
+
+    def _decode_state(self, raw):
+        _, _, ms, battery, speed, mode, status = _STATE_HEAD.unpack_from(raw)
+        robot_id, offset = self._read_text(raw, _STATE_HEAD.size)
+        location, _ = self._read_text(raw, offset)
+        return {"robotId": robot_id, "battery": battery, "speed": speed,
+                "mode": STATE_SCHEMA["mode"][mode], "currentLocation": location,
+                "status": STATE_SCHEMA["status"][status], "timeStamp": ms_to_iso(ms)}
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
+    return codec
+
+
+JSON = register_codec(JsonCodec())
+BIN1 = register_codec(BinaryCodec())
+
+
+def decode(raw):
+    # تشخیص قالب از بایت اول (برای TopicRouter(decode=...))؛ پیام‌های JSON قدیمی همچنان کار می‌کنند
+    if raw and raw[0] == MAGIC:
+        return BIN1.decode(raw)
+    return json.loads(raw)
+
+
+# ————————————————————————————————————————
+# انتخاب codec برای هر تاپیک و ربات
+# ————————————————————————————————————————
+
+# تاپیک‌هایی که قالب فشرده دارند؛ بقیه همیشه JSON
+TOPIC_CODECS = {"command": "bin1", "state": "bin1"}
+
+
+class CodecNegotiator:
+    def __init__(self, preferred=None, default="json"):
+        self.preferred = dict(TOPIC_CODECS if preferred is None else preferred)
+        self.default = CODECS[default]
+        self.peers = {}     # robot_id -> مجموعه‌ی codecهایی که ربات اعلام کرده
+        self.stats = {"encoded": 0, "fallback": 0}
+
+    def accept(self, robot_id, names):
+        self.peers[robot_id] = {n for n in names if n in CODECS}
+
+    def observe(self, robot_id, payload):
+        # اگر پیام دریافتی فیلد codecs داشت، همان را به عنوان توانایی ربات ثبت کن
+        names = payload.get(CODECS_FIELD) if isinstance(payload, dict) else None
+        if isinstance(names, list):
+            self.accept(robot_id, names)
+
+    def codec_for(self, name, robot_id):
+        preferred = self.preferred.get(name)
+        if preferred is not None and preferred in self.peers.get(robot_id, ()):
+            return CODECS[preferred]
+        return self.default
+
+    def encode(self, name, robot_id, payload):
+        codec = self.codec_for(name, robot_id)
+        self.stats["encoded"] += 1
+        if codec is not self.default:
+            try:
+                return codec.encode(name, payload)
+            except CodecError:
+                self.stats["fallback"] += 1
+        return self.default.encode(name, payload)
+
+
+# ————————————————————————————————————————
+# بنچمارک: json.dumps فعلی / JSON فشرده / bin1 — اندازه و سرعت encode و decode
+# python -m networking.mqtt.codec [iterations]
+# ————————————————————————————————————————
+
+
+def _samples():
+    return {
+        "command": {"robotId": "r1", "cmd": "forward", "value": [0.7, 0.0, 0.0, 0.0],
+                    "timeStamp": "2025-12-24T18:15:00Z"},
+        "state": {"robotId": "r1", "battery": 92, "speed": 0.5, "mode": "ai",
+                  "currentLocation": "lab", "status": "good",
+                  "timeStamp": "2025-12-24T18:16:00Z"},
+    }
+
+
+def _per_call_us(fn, arg, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return round((time.perf_counter() - t0) / iterations * 1e6, 2)
+
+
+def benchmark(iterations=50000):
+    variants = (("json_default", lambda k: (lambda p: json.dumps(p).encode()), json.loads),
+                ("json_compact", lambda k: (lambda p: JSON.encode(k, p)), JSON.decode),
+                ("bin1", lambda k: (lambda p: BIN1.encode(k, p)), BIN1.decode))
+    results = {}
+    for kind, payload in _samples().items():
+        row = {}
+        for label, make_encode, dec in variants:
+            enc = make_encode(kind)
+            raw = enc(payload)
+            row[label] = {"bytes": len(raw),
+                          "encode_us": _per_call_us(enc, payload, iterations),
+                          "decode_us": _per_call_us(dec, raw, iterations)}
+        results[kind] = row
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    for kind, row in benchmark(n).items():
+        for label, r in row.items():
+            print(f"{kind:<8} {label:<13} {r}")
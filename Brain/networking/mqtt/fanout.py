@@ -0,0 +1,140 @@
+import asyncio
+import json
+import sys
+import time
+
+from networking.mqtt.topics import topics
+from networking.mqtt.codec import CodecNegotiator, JSON, BIN1
+
+# ————————————————————————————————————————
+# پخش فرمان گروهی: cmds پیام GROUP برای هر ربات جدا روی تاپیک command خودش فرستاده می‌شود
+# (هر follower فقط فرمان خودش را parse می‌کند، مستقل از اندازه‌ی گروه)
+# فرمان تکراری (همان cmd و value) فرستاده نمی‌شود، مگر از آخرین ارسال refresh ثانیه گذشته باشد
+# ————————————————————————————————————————
+
+# شناسه‌ی ربات داخل تاپیک قرار می‌گیرد؛ / و wildcardها تاپیک را خراب می‌کنند
+TOPIC_UNSAFE = set("/+#")
+
+SENT = "sent"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+
+def valid_robot_id(robot_id):
+    return isinstance(robot_id, str) and bool(robot_id) and not TOPIC_UNSAFE.intersection(robot_id)
+
+
+class GroupFanout:
+    def __init__(self, transport, qos=0, delta=True, refresh=2.0):
+        self.transport = transport   # MqttTransport (codec هر ربات از transport.codecs)
+        self.qos = qos
+        self.delta = delta
+        self.refresh = refresh       # ثانیه؛ ارسال دوباره‌ی فرمان بدون تغییر برای ربات‌هایی که پیام را از دست داده‌اند
+        self.last = {}               # robot_id -> (cmd, value, زمان آخرین ارسال موفق)
+        self.stats = {"groups": 0, "sent": 0, "unchanged": 0, "failed": 0}
+
+    def forget(self, robot_id=None):
+        # مثلاً بعد از اتصال دوباره‌ی ربات: فرمان بعدی حتماً فرستاده شود
+        if robot_id is None:
+            self.last.clear()
+        else:
+            self.last.pop(robot_id, None)
+
+    def _changed(self, robot_id, cmd, now):
+        prev = self.last.get(robot_id)
+        if not self.delta or prev is None:
+            return True
+        return (prev[0], prev[1]) != (cmd["cmd"], tuple(cmd["value"])) or now - prev[2] >= self.refresh
+
+    def split(self, group):
+        # آخرین فرمان هر ربات در cmds (اگر یک ربات دو بار آمده باشد)
+        for cmd in group["cmds"]:
+            if not valid_robot_id(cmd["robotId"]):
+                raise ValueError(f"invalid robotId: {cmd['robotId']!r}")
+        return {cmd["robotId"]: cmd for cmd in group["cmds"]}
+
+    async def dispatch(self, group):
+        # خروجی: robot_id -> sent / unchanged / failed ؛ robotId نامعتبر -> ValueError (قبل از هر ارسال)
+        now = time.monotonic()
+        commands = self.split(group)
+        self.stats["groups"] += 1
+        results, pending = {}, []
+        # همه‌ی فرمان‌های تغییرکرده اول در صف می‌روند (یک دسته)، بعد تأییدها با هم منتظر می‌مانند
+        for robot_id, cmd in commands.items():
+            if not self._changed(robot_id, cmd, now):
+                results[robot_id] = UNCHANGED
+                continue
+            results[robot_id] = None     # ترتیب خروجی همان ترتیب cmds
+            topic = topics["command"].format(id=robot_id)
+            pending.append((robot_id, cmd, await self.transport.enqueue(topic, cmd, self.qos)))
+
+        acks = await asyncio.gather(*(fut for _, _, fut in pending), return_exceptions=True)
+        for (robot_id, cmd, _), ack in zip(pending, acks):
+            if isinstance(ack, Exception):
+                results[robot_id] = FAILED
+                self.last.pop(robot_id, None)   # دفعه‌ی بعد حتماً دوباره فرستاده شود
+            else:
+                results[robot_id] = SENT
+                self.last[robot_id] = (cmd["cmd"], tuple(cmd["value"]), now)
+        for status in results.values():
+            self.stats[status] += 1
+        return results
+
+
+# ————————————————————————————————————————
+# بنچمارک: بایت و زمان parse برای هر follower با بزرگ شدن گروه
+# کل پیام گروهی (روش قبلی) / فرمان تکی JSON / فرمان تکی bin1 ، و تعداد ارسال با delta
+# python -m networking.mqtt.fanout [iterations]
+# ————————————————————————————————————————
+
+
+def _group(n, step=0):
+    # هر دور فقط حدود ۱۰٪ رباتها فرمان تازه می‌گیرند
+    cmds = [{"robotId": f"r{i + 1}", "cmd": "forward" if (i + step) % 10 else "left",
+             "value": [0.5, 0.0, 0.0, 0.0], "timeStamp": "2025-12-24T18:15:00Z"} for i in range(n)]
+    return {"robotLeaderId": "r1", "cmds": cmds, "timeStamp": "2025-12-24T18:19:00Z"}
+
+
+def _parse_us(raw, decode, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        decode(raw)
+    return round((time.perf_counter() - t0) / iterations * 1e6, 2)
+
+
+async def _delta_run(n, rounds, delta):
+    from networking.mqtt.local_broker import LocalBroker
+    from networking.mqtt.transport import MqttTransport
+    client = LocalBroker(ack_delay=0).client()
+    client.connect()
+    transport = MqttTransport(client, codecs=CodecNegotiator())
+    fanout = GroupFanout(transport, delta=delta, refresh=60.0)
+    for step in range(rounds):
+        await fanout.dispatch(_group(n, step))
+    await transport.stop()
+    return fanout.stats["sent"]
+
+
+def benchmark(sizes=(2, 8, 32, 128), iterations=2000, rounds=20):
+    results = {}
+    for n in sizes:
+        group = _group(n)
+        legacy = json.dumps(group).encode()
+        cmd = group["cmds"][-1]
+        single_json = JSON.encode("command", cmd)
+        single_bin = BIN1.encode("command", cmd)
+        results[n] = {
+            "legacy_bytes": len(legacy), "legacy_parse_us": _parse_us(legacy, json.loads, iterations),
+            "json_bytes": len(single_json), "json_parse_us": _parse_us(single_json, JSON.decode, iterations),
+            "bin1_bytes": len(single_bin), "bin1_parse_us": _parse_us(single_bin, BIN1.decode, iterations),
+            f"sends_{rounds}_rounds_full": asyncio.run(_delta_run(n, rounds, False)),
+            f"sends_{rounds}_rounds_delta": asyncio.run(_delta_run(n, rounds, True)),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("per follower, per group message")
+    for size, row in benchmark(iterations=n).items():
+        print(f"robots={size:<4} {row}")
@@ -0,0 +1,113 @@
+import itertools
+import queue
+import threading
+import time
+
+# ————————————————————————————————————————
+# بروکر محلی برای تست بدون mosquitto: کلاینت‌ها API شبیه paho دارند
+# لینک کند ESP32 با یک نخ و تأخیر/پهنای باند ثابت شبیه‌سازی می‌شود (پیام‌ها پشت‌سرهم رد می‌شوند)
+# ————————————————————————————————————————
+
+
+def topic_matches(pattern, topic):
+    # فیلتر اشتراک MQTT: + یک سطح، # بقیه‌ی سطح‌ها
+    p_parts, t_parts = pattern.split("/"), topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts) or (p != "+" and p != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+class MessageInfo:
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+
+
+class Message:
+    def __init__(self, topic, payload, qos):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+
+
+class LocalBroker:
+    def __init__(self, ack_delay=0.002, bandwidth=None):
+        self.ack_delay = ack_delay      # تأخیر ثابت هر پیام (ثانیه)
+        self.bandwidth = bandwidth      # بایت بر ثانیه؛ None یعنی نامحدود
+        self.subscriptions = []         # (pattern, client)
+        self.link = queue.Queue()       # صف لینک؛ عمداً بی‌حد مثل بافر خروجی paho
+        self.backlog_bytes = 0
+        self.stats = {"delivered": 0, "max_backlog": 0, "max_backlog_bytes": 0}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def client(self):
+        return LocalClient(self)
+
+    def _submit(self, client, mid, msg):
+        with self._lock:
+            self.backlog_bytes += len(msg.payload)
+            self.stats["max_backlog_bytes"] = max(self.stats["max_backlog_bytes"], self.backlog_bytes)
+        self.link.put((client, mid, msg))
+        self.stats["max_backlog"] = max(self.stats["max_backlog"], self.link.qsize())
+
+    def _run(self):
+        while True:
+            client, mid, msg = self.link.get()
+            delay = self.ack_delay
+            if self.bandwidth:
+                delay += len(msg.payload) / self.bandwidth
+            if delay > 0:
+                time.sleep(delay)
+            with self._lock:
+                self.backlog_bytes -= len(msg.payload)
+            for pattern, sub in list(self.subscriptions):
+                if topic_matches(pattern, msg.topic) and sub.on_message is not None:
+                    sub.on_message(sub, sub.userdata, msg)
+            self.stats["delivered"] += 1
+            if client.on_publish is not None:
+                client.on_publish(client, client.userdata, mid)
+
+
+class LocalClient:
+    # زیرمجموعه‌ای از paho.mqtt.client.Client که در این پروژه استفاده می‌شود
+    def __init__(self, broker):
+        self.broker = broker
+        self.userdata = None
+        self.on_connect = None
+        self.on_message = None
+        self.on_publish = None
+        self.connected = False
+        self._mids = itertools.count(1)
+
+    def connect(self, host="localhost", port=1883, keepalive=60):
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, self.userdata, {}, 0)
+        return 0
+
+    def disconnect(self):
+        self.connected = False
+        return 0
+
+    def loop_start(self):
+        return 0
+
+    def loop_stop(self):
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscriptions.append((topic, self))
+        return 0, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        mid = next(self._mids)
+        if not self.connected:
+            return MessageInfo(mid, rc=4)    # MQTT_ERR_NO_CONN
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.broker._submit(self, mid, Message(topic, payload or b"", qos))
+        return MessageInfo(mid)
@@ -1,6 +1,10 @@
 COMMAND_SCHEMA = {
     "robotId": "string",
-    "cmd": ["forward", "backward", "left", "right", "rotate", "rotate-reverse", "slow speed", "fast speed"],
+    # new names are only appended: the list index is the numeric cmd code in the bin1 codec
+    "cmd": ["forward", "backward", "left", "right", "rotate", "rotate-reverse", "slow speed", "fast speed",
+            # commands emitted by the vision brains (decide) and the simulator UI; one spelling per command
+            "stop", "turn_left", "turn_right", "slow_forward", "turn_left_escape", "turn_right_180",
+            "increase_speed", "decrease_speed"],
     "value": "array[float]",
     "timeStamp": "string",  # point: this type in input must be datetime
 }
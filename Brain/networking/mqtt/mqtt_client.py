@@ -1,75 +1,48 @@
+import asyncio
 import json
-import time
+import sys
 import paho.mqtt.client as mqtt
 
 # اگر ساختار پروژه‌ات اینه: Brain/networking/mqtt/...
 from networking.mqtt.topics import topics
+from networking.mqtt.router import TopicRouter
+from networking.mqtt.codec import CodecNegotiator, decode
+from networking.mqtt.transport import MqttTransport
+from networking.mqtt.local_broker import LocalBroker
+from networking.mqtt.validators import compile_schema, explain
 from networking.mqtt.message_schema import (
     COMMAND_SCHEMA, ERROR_SCHEMA, STATE_SCHEMA, GROUP_SCHEMA,
     WARNING_SCHEMA, STREAM_STATE_SCHEMA
 )
 
 # ————————————————————————————————————————
-# کمک‌تابع‌ها: اعتبارسنجی خیلی ساده و چاپ مرتب
+# کمک‌تابع‌ها: اعتبارسنجی و چاپ مرتب
 # ————————————————————————————————————————
 
 
-def is_json_payload(msg):
-    try:
-        json.loads(msg)
-        return True
-    except Exception:
-        return False
-
-
 def pretty_print(label, obj):
     print(f"[{label}] => {json.dumps(obj, ensure_ascii=False, indent=2)}")
 
-# اعتبارسنجی مینیمال مطابق schemaها (ساده، غیرسخت‌گیرانه)
-
-
-def validate_command(payload: dict) -> bool:
-    required = ["robotId", "cmd", "value", "timeStamp"]
-    return all(k in payload for k in required)
-
-
-def validate_state(payload: dict) -> bool:
-    required = ["robotId", "battery", "speed", "mode",
-                "currentLocation", "status", "timeStamp"]
-    return all(k in payload for k in required)
-
-
-def validate_error(payload: dict) -> bool:
-    required = ["robotId", "error-code",
-                "severity", "notification", "timeStamp"]
-    return all(k in payload for k in required)
-
-
-def validate_warning(payload: dict) -> bool:
-    required = ["robotId", "warning-code",
-                "severity", "notification", "timeStamp"]
-    return all(k in payload for k in required)
+# اعتبارسنجی کامل مطابق schemaها (نوع، enum و فیلدهای تو در تو)؛
+# هر schema یک بار به تابع بررسی compile می‌شود (networking.mqtt.validators)
 
-
-def validate_group(payload: dict) -> bool:
-    required = ["robotLeaderId", "cmds", "timeStamp"]
-    return all(k in payload for k in required)
-
-
-def validate_stream_state(payload: dict) -> bool:
-    required = ["robotId", "resolution", "internetStatus", "timeStamp", "port"]
-    return all(k in payload for k in required)
+validate_command = compile_schema(COMMAND_SCHEMA)
+validate_state = compile_schema(STATE_SCHEMA)
+validate_error = compile_schema(ERROR_SCHEMA)
+validate_warning = compile_schema(WARNING_SCHEMA)
+validate_group = compile_schema(GROUP_SCHEMA)
+validate_stream_state = compile_schema(STREAM_STATE_SCHEMA)
 
 # ————————————————————————————————————————
 # ساخت نمونه پیام‌ها برای تست
 # ————————————————————————————————————————
 
 
-def build_command(robot_id="r1", cmd="forward", value=0.7):
+def build_command(robot_id="r1", cmd="forward", value=(0.7, 0.0, 0.0, 0.0)):
     return {
         "robotId": robot_id,
         "cmd": cmd,
-        "value": value,
+        "value": list(value),  # schema: array[float]
         "timeStamp": "2025-12-24T18:15:00Z"
     }
 
@@ -109,7 +82,8 @@ def build_warning(robot_id="r1"):
 def build_group(robot_leader_id="leader-1"):
     return {
         "robotLeaderId": robot_leader_id,
-        "cmds": [build_command("r2", "forward", 0.4), build_command("r3", "rotate", 0.2)],
+        "cmds": [build_command("r2", "forward", (0.4, 0.0, 0.0, 0.0)),
+                 build_command("r3", "rotate", (0.2, 0.0, 0.0, 0.0))],
         "timeStamp": "2025-12-24T18:19:00Z"
     }
 
@@ -128,77 +102,55 @@ def build_stream_state(robot_id="r1"):
 # ————————————————————————————————————————
 
 
+# codec هر تاپیک/ربات: تا ربات در state یا stream_state فیلد "codecs" را نفرستد، JSON
+codecs = CodecNegotiator()
+
+
+def _report(label, schema, validator):
+    def handler(robot_id, payload, topic):
+        pretty_print(label, payload)
+        codecs.observe(robot_id, payload)
+        if not validator(payload):
+            # جزئیات خطا فقط برای پیام نامعتبر ساخته می‌شود
+            print(f"Invalid {label} payload:", "; ".join(explain(schema, payload)))
+    return handler
+
+
+# الگوهای تاپیک یک بار کامپایل می‌شوند؛ robot_id از خود تاپیک خوانده می‌شود
+# payload می‌تواند JSON یا bin1 باشد (از بایت اول تشخیص داده می‌شود)
+router = TopicRouter(topics, decode=decode)
+router.on("command", _report("COMMAND", COMMAND_SCHEMA, validate_command))
+router.on("state", _report("STATE", STATE_SCHEMA, validate_state))
+router.on("errors", _report("ERROR", ERROR_SCHEMA, validate_error))
+router.on("warning", _report("WARNING", WARNING_SCHEMA, validate_warning))
+router.on("group_command", _report("GROUP", GROUP_SCHEMA, validate_group))
+router.on("stream_state", _report("STREAM_STATE", STREAM_STATE_SCHEMA, validate_stream_state))
+
+
+@router.on_unknown
+def _unknown_topic(topic, payload):
+    # wildcard یا تاپیک‌های جدید
+    pretty_print("UNKNOWN_TOPIC", {"topic": topic, "payload": payload})
+
+
+@router.on_invalid
+def _invalid_payload(topic, raw, error):
+    print("Payload is not valid JSON. Raw:", raw)
+
+
 def on_connect(client, userdata, flags, rc):
     print("Connected with result code", rc)
 
-    # subscribe روی همهٔ تاپیک‌های اصلی
-    # فرض: topics یک دیکشنری با کلیدهای منطقی و مقدار الگوی رشته‌ای است
-    # مثلا: topics["command"] = "/robot/{id}/command"
-    subs = [
-        topics["command"].format(id="r1"),
-        topics["state"].format(id="r1"),
-        topics["error"].format(id="r1"),
-        topics["warning"].format(id="r1"),
-        topics["group"],                 # اگر آیدی ندارد و global است
-        topics["stream_state"].format(id="r1")
-    ]
-    for t in subs:
+    # subscribe روی همهٔ تاپیک‌های اصلی با wildcard (+ به جای id) برای همهٔ ربات‌ها
+    for t in router.subscriptions():
         client.subscribe(t)
         print(f"Subscribed to: {t}")
 
 
 def on_message(client, userdata, msg):
-    raw = msg.payload.decode()
     print(f"Message received: {msg.topic}")
-    if not is_json_payload(raw):
-        print("Payload is not valid JSON. Raw:", raw)
-        return
-
-    payload = json.loads(raw)
-
-    # با توجه به تاپیک، اعتبارسنجی و ثبت
     try:
-        if msg.topic == topics["command"].format(id=payload.get("robotId", "r1")):
-            ok = validate_command(payload)
-            pretty_print("COMMAND", payload)
-            if not ok:
-                print("Invalid COMMAND payload")
-
-        elif msg.topic == topics["state"].format(id=payload.get("robotId", "r1")):
-            ok = validate_state(payload)
-            pretty_print("STATE", payload)
-            if not ok:
-                print("Invalid STATE payload")
-
-        elif msg.topic == topics["error"].format(id=payload.get("robotId", "r1")):
-            ok = validate_error(payload)
-            pretty_print("ERROR", payload)
-            if not ok:
-                print("Invalid ERROR payload")
-
-        elif msg.topic == topics["warning"].format(id=payload.get("robotId", "r1")):
-            ok = validate_warning(payload)
-            pretty_print("WARNING", payload)
-            if not ok:
-                print("Invalid WARNING payload")
-
-        elif msg.topic == topics["group"]:
-            ok = validate_group(payload)
-            pretty_print("GROUP", payload)
-            if not ok:
-                print("Invalid GROUP payload")
-
-        elif msg.topic == topics["stream_state"].format(id=payload.get("robotId", "r1")):
-            ok = validate_stream_state(payload)
-            pretty_print("STREAM_STATE", payload)
-            if not ok:
-                print("Invalid STREAM_STATE payload")
-
-        else:
-            # wildcard یا تاپیک‌های جدید
-            pretty_print("UNKNOWN_TOPIC", {
-                         "topic": msg.topic, "payload": payload})
-
+        router.dispatch(msg.topic, msg.payload)
     except Exception as e:
         print("Error processing message:", e)
 
@@ -207,42 +159,58 @@ def on_message(client, userdata, msg):
 # ————————————————————————————————————————
 
 
-def publish_all_samples(client, robot_id="r1"):
+async def publish_all_samples(transport, robot_id="r1"):
+    # همه با هم در صف می‌روند؛ صف محدود transport جلوی انفجار حافظه را می‌گیرد
     samples = [
-        (topics["command"].format(id=robot_id), build_command(robot_id)),
-        (topics["state"].format(id=robot_id), build_state(robot_id)),
-        (topics["error"].format(id=robot_id), build_error(robot_id)),
-        (topics["warning"].format(id=robot_id), build_warning(robot_id)),
-        (topics["group"], build_group("leader-1")),
-        (topics["stream_state"].format(id=robot_id),
-         build_stream_state(robot_id)),
+        ("command", build_command(robot_id)),
+        ("state", build_state(robot_id)),
+        ("errors", build_error(robot_id)),
+        ("warning", build_warning(robot_id)),
+        ("group_command", build_group("leader-1")),
+        ("stream_state", build_stream_state(robot_id)),
     ]
-    for topic, payload in samples:
-        client.publish(topic, json.dumps(payload))
-        print(f"Published to {topic}")
-        time.sleep(0.3)
+    sent = [(topics[name].format(id=robot_id), payload) for name, payload in samples]
+    acks = await asyncio.gather(*(transport.publish(topic, payload) for topic, payload in sent),
+                                return_exceptions=True)
+    for (topic, _), ack in zip(sent, acks):
+        if isinstance(ack, Exception):
+            print(f"Publish to {topic} failed: {ack!r}")
+        else:
+            print(f"Published to {topic} (ack after {ack:.1f} ms)")
 
 # ————————————————————————————————————————
 # اجرای کلاینت
+# python -m networking.mqtt.mqtt_client [--local]   (--local: بروکر محلی داخل برنامه به جای mosquitto)
 # ————————————————————————————————————————
 
 
-def main():
+async def run(client):
+    transport = MqttTransport(client, codecs=codecs)
+    transport.start()
+
+    # چند پیام تستی بفرستیم تا همهٔ تاپیک‌ها را ببینیم
+    await publish_all_samples(transport, robot_id="r1")
+    print("Transport:", transport.summary())
+
+    # برنامه روشن می‌ماند تا پیام‌ها را دریافت کند
+    try:
+        while True:
+            await asyncio.sleep(1)
+    finally:
+        await transport.stop(drain=False)
+
+
+def main(local=False):
     # نسخهٔ جدید callback API برای حذف DeprecationWarning
-    client = mqtt.Client()
+    client = LocalBroker().client() if local else mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
 
     client.connect("localhost", 1883, 60)
     client.loop_start()  # دریافت پیام‌ها در background
 
-    # چند پیام تستی بفرستیم تا همهٔ تاپیک‌ها را ببینیم
-    publish_all_samples(client, robot_id="r1")
-
-    # برنامه روشن می‌ماند تا پیام‌ها را دریافت کند
     try:
-        while True:
-            time.sleep(1)
+        asyncio.run(run(client))
     except KeyboardInterrupt:
         print("Stopping...")
     finally:
@@ -251,4 +219,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(local="--local" in sys.argv[1:])
@@ -0,0 +1,178 @@
+import json
+import sys
+import time
+
+from networking.mqtt.topics import topics
+
+# ————————————————————————————————————————
+# مسیریاب تاپیک‌ها: الگوهای topics یک بار کامپایل می‌شوند؛
+# هر پیام با یک جستجوی دیکشنری به handler می‌رسد و payload فقط یک بار parse می‌شود
+# ————————————————————————————————————————
+
+ID_FIELD = "{id}"
+
+
+class TopicRouter:
+    def __init__(self, templates=None, cache_size=4096, decode=json.loads):
+        # decode(raw) -> payload ؛ باید برای ورودی نامعتبر ValueError بدهد (مثل networking.mqtt.codec.decode)
+        self.templates = dict(templates or topics)
+        self.decode = decode
+        self.handlers = {}
+        self.unknown_handler = None
+        self.invalid_handler = None
+        self.cache = {}              # topic -> (name, robot_id)
+        self.cache_size = cache_size
+        self.stats = {"routed": 0, "unknown": 0, "invalid_json": 0, "unhandled": 0}
+        self._compile()
+
+    def _compile(self):
+        # کلید: (طول تاپیک، جای id، بخش‌های ثابت) ؛ برای هر تاپیک فقط چند «شکل» ثابت امتحان می‌شود
+        # (مستقل از تعداد ربات‌ها)
+        self.table = {}
+        self.shapes = {}
+        for name, template in self.templates.items():
+            parts = template.split("/")
+            pos = parts.index(ID_FIELD) if ID_FIELD in parts else None
+            literal = tuple(p for i, p in enumerate(parts) if i != pos)
+            key = (len(parts), pos, literal)
+            if key in self.table:
+                raise ValueError(f"topics {self.table[key]!r} and {name!r} overlap")
+            self.table[key] = name
+            shapes = self.shapes.setdefault(len(parts), [])
+            if pos not in shapes:
+                shapes.append(pos)
+
+    def match(self, topic):
+        # خروجی: (نام منطقی تاپیک، robot_id یا None) یا None
+        hit = self.cache.get(topic)
+        if hit is not None:
+            return hit
+        parts = topic.split("/")
+        for pos in self.shapes.get(len(parts), ()):
+            literal = tuple(p for i, p in enumerate(parts) if i != pos)
+            name = self.table.get((len(parts), pos, literal))
+            if name is not None:
+                hit = (name, parts[pos] if pos is not None else None)
+                if len(self.cache) >= self.cache_size:
+                    self.cache.clear()
+                self.cache[topic] = hit
+                return hit
+        return None
+
+    def on(self, name, handler=None):
+        # handler(robot_id, payload, topic) ؛ به صورت دکوراتور هم قابل استفاده است
+        if name not in self.templates:
+            raise KeyError(f"unknown topic: {name}")
+        if handler is None:
+            return lambda fn: self.on(name, fn)
+        self.handlers[name] = handler
+        return handler
+
+    def on_unknown(self, handler):
+        # handler(topic, payload)
+        self.unknown_handler = handler
+        return handler
+
+    def on_invalid(self, handler):
+        # handler(topic, raw_bytes, error)
+        self.invalid_handler = handler
+        return handler
+
+    def subscriptions(self, robot_ids=None):
+        # بدون robot_ids: یک اشتراک wildcard برای هر تاپیک (+ به جای id) برای همه‌ی ربات‌ها
+        if robot_ids is None:
+            return [t.replace(ID_FIELD, "+") for t in self.templates.values()]
+        return [t.format(id=r) if ID_FIELD in t else t
+                for t in self.templates.values() for r in robot_ids]
+
+    def dispatch(self, topic, raw):
+        # raw: bytes یا str ؛ json.loads بایت را مستقیم می‌پذیرد (بدون decode جداگانه)
+        hit = self.match(topic)
+        try:
+            payload = self.decode(raw)
+        except ValueError as e:
+            self.stats["invalid_json"] += 1
+            if self.invalid_handler is not None:
+                self.invalid_handler(topic, raw, e)
+            return None
+
+        if hit is None:
+            self.stats["unknown"] += 1
+            if self.unknown_handler is not None:
+                self.unknown_handler(topic, payload)
+            return None
+
+        name, robot_id = hit
+        handler = self.handlers.get(name)
+        if handler is None:
+            self.stats["unhandled"] += 1
+            return None
+        self.stats["routed"] += 1
+        return handler(robot_id, payload, topic)
+
+    def on_message(self, client, userdata, msg):
+        # سازگار با callback کتابخانه‌ی paho
+        return self.dispatch(msg.topic, msg.payload)
+
+
+# ————————————————————————————————————————
+# بنچمارک: زنجیره‌ی if/elif قبلی در برابر مسیریاب، با پیام‌های مصنوعی برای تعداد زیادی ربات
+# python -m networking.mqtt.router [robots] [messages]
+# ————————————————————————————————————————
+
+
+def _legacy_dispatch(topic, raw, handlers):
+    # همان الگوی on_message قبلی: دو بار parse و ساختن دوباره‌ی همه‌ی تاپیک‌ها برای هر پیام
+    raw = raw.decode()
+    try:
+        json.loads(raw)
+    except Exception:
+        return None
+    payload = json.loads(raw)
+    robot_id = payload.get("robotId", "r1")
+    for name, template in topics.items():
+        if topic == template.format(id=robot_id):
+            return handlers[name](robot_id, payload, topic)
+    return None
+
+
+def _synthetic_messages(n_robots, n_messages):
+    names = [n for n, t in topics.items() if ID_FIELD in t]
+    messages = []
+    for i in range(n_messages):
+        robot_id = f"r{i % n_robots + 1}"
+        name = names[i % len(names)]
+        payload = {"robotId": robot_id, "cmd": "forward", "value": [0.5, 0, 0, 0],
+                   "timeStamp": "2025-12-24T18:15:00Z"}
+        messages.append((topics[name].format(id=robot_id), json.dumps(payload).encode()))
+    return messages
+
+
+def benchmark(n_robots=500, n_messages=50000):
+    messages = _synthetic_messages(n_robots, n_messages)
+    count = {"n": 0}
+
+    def handler(robot_id, payload, topic):
+        count["n"] += 1
+
+    handlers = {name: handler for name in topics}
+    router = TopicRouter()
+    for name in topics:
+        router.on(name, handler)
+
+    results = {"robots": n_robots, "messages": n_messages}
+    for label, dispatch in (("legacy", lambda t, r: _legacy_dispatch(t, r, handlers)),
+                            ("router", router.dispatch)):
+        count["n"] = 0
+        t0 = time.perf_counter()
+        for topic, raw in messages:
+            dispatch(topic, raw)
+        dt = time.perf_counter() - t0
+        results[label] = {"msgs_per_s": round(n_messages / dt), "routed": count["n"]}
+    return results
+
+
+if __name__ == "__main__":
+    n_robots = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    print(benchmark(n_robots, n_messages))
@@ -7,4 +7,5 @@ topics = {
     "group_command": "/robot/group/{id}/group_command",
     "connection": "/robot/{id}/connection",
     "image_meta": "/robot/{id}/image_meta",
+    "stream_state": "/robot/{id}/stream_state",
 }
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+
+from networking.mqtt.router import TopicRouter
+from networking.mqtt.codec import JSON
+
+# ————————————————————————————————————————
+# لایه‌ی انتقال asyncio روی کلاینت paho (loop_start در نخ جدا):
+# صف خروجی محدود، جایگزینی پیام‌های «آخرین مقدار»، سقف پیام‌های در راه برای هر QoS
+# و تأیید قابل await برای هر publish (با زمان تأخیر)
+# ————————————————————————————————————————
+
+# تاپیک‌هایی که فقط آخرین مقدار مهم است؛ پیام قبلیِ هنوز ارسال‌نشده جایگزین می‌شود
+LATEST_VALUE_TOPICS = ("state", "stream_state")
+# حداکثر پیام ارسال‌شده و هنوز تأییدنشده برای هر QoS
+INFLIGHT_LIMITS = {0: 64, 1: 16, 2: 8}
+MQTT_ERR_SUCCESS = 0
+
+
+class _Entry:
+    __slots__ = ("topic", "payload", "qos", "key", "futures", "t_enqueued", "timer")
+
+    def __init__(self, topic, payload, qos, key, fut):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.key = key
+        self.futures = [fut]
+        self.t_enqueued = time.monotonic()
+        self.timer = None
+
+
+class MqttTransport:
+    def __init__(self, client, max_queue=256, inflight=None, coalesce=LATEST_VALUE_TOPICS,
+                 ack_timeout=10.0, codecs=None, router=None, latency_window=1000):
+        self.client = client
+        self.max_queue = max_queue
+        self.inflight_limits = {**INFLIGHT_LIMITS, **(inflight or {})}
+        self.coalesce = set(coalesce)
+        self.ack_timeout = ack_timeout
+        self.codecs = codecs            # CodecNegotiator برای payloadهای dict ؛ None یعنی JSON
+        self.router = router or TopicRouter()
+        self.queue = deque()
+        self.latest = {}                # topic -> _Entry در صف (فقط تاپیک‌های آخرین مقدار)
+        self.inflight = {}              # mid -> _Entry
+        self.latencies = deque(maxlen=latency_window)   # enqueue تا ack (ms)
+        self.stats = {"queued": 0, "sent": 0, "acked": 0, "coalesced": 0, "failed": 0,
+                      "timeouts": 0, "max_depth": 0, "max_inflight": 0}
+        self.loop = None
+        self.task = None
+        self._slots = None
+        self._inflight_slots = None
+        self._ready = None
+        self._idle = None
+        client.on_publish = self.on_publish
+
+    # ———— راه‌اندازی ————
+
+    def start(self):
+        # باید داخل event loop صدا زده شود؛ Task فرستنده را برمی‌گرداند
+        if self.task is None:
+            self.loop = asyncio.get_running_loop()
+            self._slots = asyncio.Semaphore(self.max_queue)
+            self._inflight_slots = {q: asyncio.Semaphore(n) for q, n in self.inflight_limits.items()}
+            self._ready = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self.task = self.loop.create_task(self._run())
+        return self.task
+
+    async def stop(self, drain=True):
+        if self.task is None:
+            return
+        if drain:
+            await self.drain()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def drain(self):
+        # تا خالی شدن صف و رسیدن تأیید همه‌ی پیام‌های در راه
+        self.start()
+        await self._idle.wait()
+
+    def _update_idle(self):
+        if self.queue or self.inflight:
+            self._idle.clear()
+        else:
+            self._idle.set()
+
+    # ———— ارسال ————
+
+    def _encode(self, topic, payload):
+        if isinstance(payload, (bytes, bytearray, str)):
+            return payload
+        hit = self.router.match(topic)
+        if self.codecs is not None and hit is not None:
+            return self.codecs.encode(hit[0], hit[1], payload)
+        return JSON.encode(None, payload)
+
+    def _coalesce_key(self, topic):
+        hit = self.router.match(topic)
+        return topic if hit is not None and hit[0] in self.coalesce else None
+
+    def _merge(self, key, payload, qos, fut):
+        entry = self.latest.get(key)
+        if entry is None:
+            return False
+        # پیام قبلی هنوز نرفته: فقط payload عوض می‌شود و جای صف حفظ می‌شود
+        entry.payload = payload
+        entry.qos = max(entry.qos, qos)
+        entry.futures.append(fut)
+        self.stats["coalesced"] += 1
+        return True
+
+    async def enqueue(self, topic, payload, qos=0):
+        # فقط تا جا گرفتن در صف صبر می‌کند (backpressure)؛ خروجی: future تأیید (تأخیر به ms)
+        # future پیام جایگزین‌شده با تأیید پیام جدیدتر همان تاپیک کامل می‌شود
+        self.start()
+        payload = self._encode(topic, payload)
+        fut = self.loop.create_future()
+        key = self._coalesce_key(topic)
+        if key is not None and self._merge(key, payload, qos, fut):
+            return fut
+        await self._slots.acquire()
+        if key is not None and self._merge(key, payload, qos, fut):
+            self._slots.release()
+            return fut
+        entry = _Entry(topic, payload, qos, key, fut)
+        self.queue.append(entry)
+        if key is not None:
+            self.latest[key] = entry
+        self.stats["queued"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self.queue))
+        self._idle.clear()
+        self._ready.set()
+        return fut
+
+    async def publish(self, topic, payload, qos=0):
+        # تا تأیید بروکر (on_publish) صبر می‌کند؛ خروجی: تأخیر از ورود به صف تا تأیید (ms)
+        return await (await self.enqueue(topic, payload, qos))
+
+    async def _run(self):
+        while True:
+            if not self.queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            entry = self.queue.popleft()
+            if entry.key is not None:
+                del self.latest[entry.key]
+            self._slots.release()
+            # ترتیب پیام‌ها حفظ می‌شود؛ اگر سقف این QoS پر باشد پیام‌های بعدی هم منتظر می‌مانند
+            await self._inflight_slots[entry.qos].acquire()
+            self._send(entry)
+
+    def _send(self, entry):
+        try:
+            info = self.client.publish(entry.topic, entry.payload, qos=entry.qos)
+        except Exception as e:
+            # paho برای تاپیک wildcard یا qos/payload نامعتبر ValueError می‌دهد؛ فقط همین پیام خطا می‌گیرد
+            self._finish(entry, error=e)
+            return
+        if info.rc != MQTT_ERR_SUCCESS:
+            self._finish(entry, error=ConnectionError(f"publish failed (rc={info.rc})"))
+            return
+        self.inflight[info.mid] = entry
+        self.stats["sent"] += 1
+        self.stats["max_inflight"] = max(self.stats["max_inflight"], len(self.inflight))
+        entry.timer = self.loop.call_later(self.ack_timeout, self._expire, info.mid)
+
+    # ———— تأییدها (on_publish از نخ شبکه‌ی paho صدا زده می‌شود) ————
+
+    def on_publish(self, client, userdata, mid, *args):
+        # امضای paho 1.x و 2.x (reason_code, properties اضافه)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._ack, mid)
+
+    def _ack(self, mid):
+        entry = self.inflight.pop(mid, None)
+        if entry is None:
+            return
+        entry.timer.cancel()
+        latency = (time.monotonic() - entry.t_enqueued) * 1000
+        self.latencies.append(latency)
+        self.stats["acked"] += 1
+        self._finish(entry, result=latency)
+
+    def _expire(self, mid):
+        entry = self.inflight.pop(mid, None)
+        if entry is not None:
+            self.stats["timeouts"] += 1
+            self._finish(entry, error=asyncio.TimeoutError(f"no ack for mid {mid}"))
+
+    def _finish(self, entry, result=None, error=None):
+        self._inflight_slots[entry.qos].release()
+        self._update_idle()
+        if error is not None and not isinstance(error, asyncio.TimeoutError):
+            self.stats["failed"] += 1
+        for fut in entry.futures:
+            if fut.done():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+
+    def summary(self):
+        lat = sorted(self.latencies)
+        pct = (lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 2)) if lat else (lambda q: None)
+        return dict(self.stats, depth=len(self.queue), inflight=len(self.inflight),
+                    p50_ms=pct(0.5), p95_ms=pct(0.95), max_ms=round(lat[-1], 2) if lat else None)
+
+
+# ————————————————————————————————————————
+# بنچمارک با بروکر محلی و لینک کند: انفجار state از چند ربات + چند فرمان
+# publish مستقیم (وضعیت فعلی) در برابر MqttTransport
+# python -m networking.mqtt.transport [robots] [states_per_robot]
+# ————————————————————————————————————————
+
+
+def _burst(robots, states):
+    from networking.mqtt.topics import topics
+    messages = []
+    for i in range(states):
+        for r in range(robots):
+            robot_id = f"r{r + 1}"
+            messages.append((topics["state"].format(id=robot_id), {
+                "robotId": robot_id, "battery": 90, "speed": 0.1 * (i % 10), "mode": "ai",
+                "currentLocation": "lab", "status": "good", "timeStamp": "2025-12-24T18:16:00Z"}, 0))
+        if i % 10 == 9:
+            for r in range(robots):
+                robot_id = f"r{r + 1}"
+                messages.append((topics["command"].format(id=robot_id), {
+                    "robotId": robot_id, "cmd": "forward", "value": [0.5, 0.0, 0.0, 0.0],
+                    "timeStamp": "2025-12-24T18:15:00Z"}, 1))
+    return messages
+
+
+async def _direct(broker, messages):
+    # مثل mqtt_client/backend فعلی: publish بی‌درنگ، بدون محدودیت و بدون تأیید
+    client = broker.client()
+    client.connect()
+    sent, done = {}, asyncio.Event()
+    loop = asyncio.get_running_loop()
+    latencies = {"command": [], "state": []}
+
+    def on_publish(c, userdata, mid, *args):
+        kind, t0 = sent.pop(mid)
+        latencies[kind].append((time.monotonic() - t0) * 1000)
+        if not sent:
+            loop.call_soon_threadsafe(done.set)
+
+    client.on_publish = on_publish
+    for topic, payload, qos in messages:
+        kind = "command" if topic.endswith("/command") else "state"
+        info = client.publish(topic, json.dumps(payload), qos=qos)
+        sent[info.mid] = (kind, time.monotonic())
+        await asyncio.sleep(0)
+    await done.wait()
+    return latencies
+
+
+async def _transported(broker, messages, max_queue):
+    client = broker.client()
+    client.connect()
+    transport = MqttTransport(client, max_queue=max_queue)
+    transport.start()
+    latencies = {"command": [], "state": []}
+    pending = []
+    for topic, payload, qos in messages:
+        kind = "command" if topic.endswith("/command") else "state"
+        pending.append((kind, await transport.enqueue(topic, payload, qos)))
+        await asyncio.sleep(0)
+    for kind, fut in pending:
+        latencies[kind].append(await fut)
+    await transport.stop()
+    return latencies, transport.summary()
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1) if values else None
+
+
+def benchmark(robots=10, states=50, bandwidth=200_000, ack_delay=0.0005, max_queue=32):
+    from networking.mqtt.local_broker import LocalBroker
+    messages = _burst(robots, states)
+    results = {"messages": len(messages), "link_bytes_per_s": bandwidth}
+    for label in ("direct", "transport"):
+        broker = LocalBroker(ack_delay=ack_delay, bandwidth=bandwidth)
+        t0 = time.perf_counter()
+        if label == "direct":
+            latencies, extra = asyncio.run(_direct(broker, messages)), {}
+        else:
+            latencies, summary = asyncio.run(_transported(broker, messages, max_queue))
+            extra = {k: summary[k] for k in ("coalesced", "max_depth", "max_inflight")}
+        results[label] = dict(
+            seconds=round(time.perf_counter() - t0, 2),
+            delivered=broker.stats["delivered"],
+            broker_backlog_max=broker.stats["max_backlog"],
+            broker_backlog_kb_max=round(broker.stats["max_backlog_bytes"] / 1024, 1),
+            command_p95_ms=_pct(latencies["command"], 0.95),
+            state_p95_ms=_pct(latencies["state"], 0.95),
+            **extra)
+    return results
+
+
+if __name__ == "__main__":
+    robots = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    states = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    for label, row in benchmark(robots, states).items():
+        print(f"{label:<17} {row}")
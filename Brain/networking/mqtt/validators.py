@@ -0,0 +1,193 @@
+import sys
+import time
+
+from networking.mqtt.message_schema import (
+    COMMAND_SCHEMA, ERROR_SCHEMA, STATE_SCHEMA, GROUP_SCHEMA,
+    WARNING_SCHEMA, STREAM_STATE_SCHEMA
+)
+
+# ————————————————————————————————————————
+# کامپایل schemaها به تابع‌های بررسی سریع:
+# از هر schema یک بار کد پایتون خطی ساخته و compile می‌شود (بدون تفسیر schema برای هر پیام)
+# ————————————————————————————————————————
+
+# نوع‌های رشته‌ای message_schema -> کلاس‌های مجاز (bool عمداً عدد حساب نمی‌شود)
+SCALAR_TYPES = {
+    "string": (str,),
+    "int": (int,),
+    "float": (float, int),
+    "boolean": (bool,),
+}
+ARRAY_PREFIX = "array["
+
+_cache = {}    # id(schema) -> (schema, validator)
+
+
+def _class_test(var, classes):
+    return " and ".join(f"{var}.__class__ is not {c.__name__}" for c in classes)
+
+
+class _Compiler:
+    def __init__(self, strict_keys):
+        self.strict_keys = strict_keys
+        self.env = {"_MISSING": object()}
+        self.counter = 0
+
+    def name(self, prefix):
+        self.counter += 1
+        return f"_{prefix}{self.counter}"
+
+    def function(self, schema):
+        # خروجی: نام تابع کامپایل‌شده برای این schema (dict)
+        fn = self.name("check")
+        lines = [f"def {fn}(p):",
+                 "    if p.__class__ is not dict: return False"]
+        if self.strict_keys:
+            keys = self.name("keys")
+            self.env[keys] = frozenset(schema)
+            lines.append(f"    if not {keys}.issuperset(p): return False")
+        for key, spec in schema.items():
+            lines.append(f"    v = p.get({key!r}, _MISSING)")
+            lines.extend("    " + line for line in self.value("v", spec))
+        lines.append("    return True")
+        exec(compile("\n".join(lines), f"<schema {fn}>", "exec"), self.env)
+        return fn
+
+    def value(self, var, spec):
+        # خطوط بررسی یک مقدار؛ هر خط در صورت خطا False برمی‌گرداند
+        if isinstance(spec, dict):
+            return [f"if not {self.function(spec)}({var}): return False"]
+
+        if isinstance(spec, list) and len(spec) == 1 and isinstance(spec[0], dict):
+            item = self.function(spec[0])
+            return [f"if {var}.__class__ is not list: return False",
+                    f"for x in {var}:",
+                    f"    if not {item}(x): return False"]
+
+        if isinstance(spec, list):
+            # enum؛ اول نوع بررسی می‌شود تا مقدار غیرقابل hash (list/dict) خطا ندهد
+            enum = self.name("enum")
+            self.env[enum] = frozenset(spec)
+            classes = sorted({type(v) for v in spec}, key=lambda c: c.__name__)
+            return [f"if ({_class_test(var, classes)}) or {var} not in {enum}: return False"]
+
+        if isinstance(spec, str) and spec.startswith(ARRAY_PREFIX):
+            classes = SCALAR_TYPES[spec[len(ARRAY_PREFIX):-1]]
+            return [f"if {var}.__class__ is not list: return False",
+                    f"for x in {var}:",
+                    f"    if {_class_test('x', classes)}: return False"]
+
+        if spec in SCALAR_TYPES:
+            return [f"if {_class_test(var, SCALAR_TYPES[spec])}: return False"]
+
+        raise ValueError(f"unsupported schema type: {spec!r}")
+
+
+def compile_schema(schema, strict_keys=False):
+    # strict_keys=True یعنی کلید اضافه‌ی خارج از schema هم رد می‌شود
+    hit = _cache.get((id(schema), strict_keys))
+    if hit is not None and hit[0] is schema:
+        return hit[1]
+    compiler = _Compiler(strict_keys)
+    validator = compiler.env[compiler.function(schema)]
+    _cache[(id(schema), strict_keys)] = (schema, validator)
+    return validator
+
+
+# ————————————————————————————————————————
+# توضیح خطا (مسیر کند؛ فقط وقتی پیام نامعتبر است صدا زده شود)
+# ————————————————————————————————————————
+
+
+def _type_ok(value, classes):
+    return value.__class__ in classes
+
+
+def explain(schema, payload, path=""):
+    if not isinstance(payload, dict):
+        return [f"{path or 'payload'}: expected object"]
+    errors = []
+    for key, spec in schema.items():
+        where = f"{path}.{key}" if path else key
+        if key not in payload:
+            errors.append(f"{where}: missing")
+            continue
+        value = payload[key]
+        if isinstance(spec, dict):
+            errors.extend(explain(spec, value, where))
+        elif isinstance(spec, list) and len(spec) == 1 and isinstance(spec[0], dict):
+            if not isinstance(value, list):
+                errors.append(f"{where}: expected array")
+            else:
+                for i, item in enumerate(value):
+                    errors.extend(explain(spec[0], item, f"{where}[{i}]"))
+        elif isinstance(spec, list):
+            if not any(_type_ok(value, (type(v),)) for v in spec) or value not in spec:
+                errors.append(f"{where}: {value!r} not in {spec}")
+        elif spec.startswith(ARRAY_PREFIX):
+            classes = SCALAR_TYPES[spec[len(ARRAY_PREFIX):-1]]
+            if not isinstance(value, list) or not all(_type_ok(x, classes) for x in value):
+                errors.append(f"{where}: expected {spec}")
+        elif not _type_ok(value, SCALAR_TYPES[spec]):
+            errors.append(f"{where}: expected {spec}, got {type(value).__name__}")
+    return errors
+
+
+# ————————————————————————————————————————
+# بنچمارک: بررسی فقط کلیدها (روش قبلی) / تفسیر schema / تابع کامپایل‌شده
+# python -m networking.mqtt.validators [iterations]
+# ————————————————————————————————————————
+
+_LEGACY_KEYS = {
+    "command": ["robotId", "cmd", "value", "timeStamp"],
+    "state": ["robotId", "battery", "speed", "mode", "currentLocation", "status", "timeStamp"],
+    "error": ["robotId", "error-code", "severity", "notification", "timeStamp"],
+    "warning": ["robotId", "warning-code", "severity", "notification", "timeStamp"],
+    "group": ["robotLeaderId", "cmds", "timeStamp"],
+    "stream_state": ["robotId", "resolution", "internetStatus", "timeStamp", "port"],
+}
+
+
+def _samples():
+    command = {"robotId": "r1", "cmd": "forward", "value": [0.7, 0.0, 0.0, 0.0],
+               "timeStamp": "2025-12-24T18:15:00Z"}
+    notification = {"success": False, "message": "Not found"}
+    return {
+        "command": (COMMAND_SCHEMA, command),
+        "state": (STATE_SCHEMA, {"robotId": "r1", "battery": 92, "speed": 0.5, "mode": "ai",
+                                 "currentLocation": "lab", "status": "good",
+                                 "timeStamp": "2025-12-24T18:16:00Z"}),
+        "error": (ERROR_SCHEMA, {"robotId": "r1", "error-code": "404", "severity": "low",
+                                 "notification": notification, "timeStamp": "2025-12-24T18:17:00Z"}),
+        "warning": (WARNING_SCHEMA, {"robotId": "r1", "warning-code": "300", "severity": "medium",
+                                     "notification": notification, "timeStamp": "2025-12-24T18:18:00Z"}),
+        "group": (GROUP_SCHEMA, {"robotLeaderId": "r1", "cmds": [command, dict(command, robotId="r2")],
+                                 "timeStamp": "2025-12-24T18:19:00Z"}),
+        "stream_state": (STREAM_STATE_SCHEMA, {"robotId": "r1", "resolution": 720, "internetStatus": "good",
+                                               "timeStamp": "2025-12-24T18:20:00Z", "port": 8554}),
+    }
+
+
+def benchmark(iterations=100000):
+    results = {}
+    for name, (schema, payload) in _samples().items():
+        keys = _LEGACY_KEYS[name]
+        compiled = compile_schema(schema)
+        assert compiled(payload) and not explain(schema, payload), name
+        row = {}
+        for label, check in (("keys_only", lambda p: all(k in p for k in keys)),
+                             ("interpreted", lambda p: not explain(schema, p)),
+                             ("compiled", compiled)):
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                check(payload)
+            row[label] = round((time.perf_counter() - t0) / iterations * 1e9)
+        results[name] = row
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("ns per message (keys_only checks presence only; compiled also checks types/enums/nesting)")
+    for name, row in benchmark(n).items():
+        print(f"{name:<13} {row}")
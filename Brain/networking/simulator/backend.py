@@ -1,10 +1,14 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import paho.mqtt.client as mqtt
-import json
+import asyncio
 from datetime import datetime
 
 from networking.mqtt.topics import topics
+from networking.mqtt.router import TopicRouter
+from networking.mqtt.codec import CodecNegotiator, decode
+from networking.mqtt.transport import MqttTransport
+from networking.mqtt.fanout import GroupFanout, FAILED, valid_robot_id
 from networking.hotspot.manager import HotspotManager
 from networking.webrtc.connection import WebRTCConnection
 from fastapi.middleware.cors import CORSMiddleware
@@ -25,6 +29,33 @@ mqtt_client = mqtt.Client()
 mqtt_client.connect("localhost", 1883, 60)
 mqtt_client.loop_start()
 
+# codec هر ربات (bin1 یا JSON) از فیلد "codecs" پیام‌های state/stream_state خود ربات یاد گرفته می‌شود
+codecs = CodecNegotiator()
+router = TopicRouter(topics, decode=decode)
+for _name in ("state", "stream_state"):
+    router.on(_name, lambda robot_id, payload, topic: codecs.observe(robot_id, payload))
+for _topic in router.subscriptions():
+    mqtt_client.subscribe(_topic)
+mqtt_client.on_message = router.on_message
+
+# صف خروجی محدود و تأیید هر publish؛ بدون coalesce چون پیام‌های webrtc روی تاپیک state می‌روند
+transport = MqttTransport(mqtt_client, coalesce=(), codecs=codecs)
+# فرمان گروهی برای هر ربات جدا روی تاپیک command خودش (فقط فرمان‌های تغییرکرده)
+fanout = GroupFanout(transport)
+
+
+@app.on_event("startup")
+async def start_transport():
+    transport.start()
+
+
+async def publish(topic, payload):
+    # تا تأیید بروکر صبر می‌کند؛ خروجی: تأخیر (ms) یا None اگر ارسال نشد
+    try:
+        return await transport.publish(topic, payload)
+    except (ConnectionError, ValueError, asyncio.TimeoutError):
+        return None
+
 # Hotspot Manager (demo)
 hotspot = HotspotManager()
 
@@ -58,7 +89,8 @@ async def robot_command(robot_id: str, request: Request):
         return JSONResponse({"error": "value must be an array of 4 numbers"}, status_code=400)
 
     topic = topics["command"].format(id=robot_id)
-    mqtt_client.publish(topic, json.dumps(data))
+    if await publish(topic, data) is None:
+        return JSONResponse({"error": "mqtt publish failed"}, status_code=503)
 
     # Update status and logs
     robots_status[robot_id]["last_command"] = data
@@ -82,23 +114,33 @@ async def group_command(robot_id: str, request: Request):
         return JSONResponse({"error": "robot not found"}, status_code=404)
 
     data = await request.json()
+    # fan-out needs robotId/cmd/value on every command
+    cmds = data.get("cmds") if isinstance(data, dict) else None
+    if not isinstance(cmds, list) or not all(isinstance(c, dict) and {"robotId", "cmd", "value"} <= c.keys() for c in cmds):
+        return JSONResponse({"error": "cmds must be a list of commands with robotId, cmd and value"}, status_code=400)
+    # followers must be known robots; the id goes into the MQTT topic
+    for cmd in cmds:
+        if not valid_robot_id(cmd["robotId"]) or cmd["robotId"] not in robots_status:
+            return JSONResponse({"error": f"unknown robot in cmds: {cmd['robotId']!r}"}, status_code=400)
     # Validate each command in group has value as array of 4 numbers
-    if "cmds" in data:
-        for cmd in data["cmds"]:
-            if "value" in cmd and (not isinstance(cmd["value"], list) or len(cmd["value"]) != 4):
-                return JSONResponse({"error": "each command value must be an array of 4 numbers"}, status_code=400)
+    for cmd in cmds:
+        if not isinstance(cmd["value"], list) or len(cmd["value"]) != 4:
+            return JSONResponse({"error": "each command value must be an array of 4 numbers"}, status_code=400)
 
-    topic = topics["group_command"].format(id=robot_id)
-    mqtt_client.publish(topic, json.dumps(data))
+    # robot_id همان leader است؛ هر follower فقط فرمان خودش را روی /robot/{id}/command می‌گیرد
+    results = await fanout.dispatch(data)
 
     command_logs.append({
         "robot": robot_id,
         "action": "group_command",
         "payload": data,
+        "robots": results,
         "time": datetime.utcnow().isoformat() + "Z"
     })
 
-    return JSONResponse({"status": "group_sent", "command": data})
+    if FAILED in results.values():
+        return JSONResponse({"error": "mqtt publish failed", "robots": results}, status_code=503)
+    return JSONResponse({"status": "group_sent", "command": data, "robots": results})
 
 # -------------------------------
 # Hotspot APIs (demo per robot)
@@ -112,7 +154,7 @@ async def start_hotspot(robot_id: str):
 
     robots_status[robot_id]["connected"] = True
     topic = topics["connection"].format(id=robot_id)
-    mqtt_client.publish(topic, json.dumps({"status": "started"}))
+    await publish(topic, {"status": "started"})
 
     command_logs.append({
         "robot": robot_id,
@@ -129,7 +171,7 @@ async def stop_hotspot(robot_id: str):
 
     robots_status[robot_id]["connected"] = False
     topic = topics["connection"].format(id=robot_id)
-    mqtt_client.publish(topic, json.dumps({"status": "stopped"}))
+    await publish(topic, {"status": "stopped"})
 
     command_logs.append({
         "robot": robot_id,
@@ -162,7 +204,7 @@ async def webrtc_offer(robot_id: str, request: Request):
         "sdp": f"fake-sdp-for-{robot_id}"
     }
     topic = topics["state"].format(id=robot_id)
-    mqtt_client.publish(topic, json.dumps({"webrtc_offer": data}))
+    await publish(topic, {"webrtc_offer": data})
 
     command_logs.append({
         "robot": robot_id,
@@ -179,7 +221,7 @@ async def webrtc_status(robot_id: str):
         return JSONResponse({"error": "robot not found"}, status_code=404)
 
     topic = topics["state"].format(id=robot_id)
-    mqtt_client.publish(topic, json.dumps({"webrtc_status": "checked"}))
+    await publish(topic, {"webrtc_status": "checked"})
 
     command_logs.append({
         "robot": robot_id,